@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+from common.shared_main import do_elections
+from common.trace import ElectionTrace
+from common.types import Ballot, Election
+from generator import generate_ballots, generate_unique_rankings
+from voting_system import elections_test, process_election, process_round, recalculate_ballots
+
+'''
+Benchmark suite for Hayden's method
+Sweeps generator.py's parameters one at a time around a base election and times the engine entry points.
+'''
+
+# Base election; each sweep varies one of these
+BASE = {"candidates": 10, "voters": 10000, "unique": 1000, "seats": 3}
+SWEEPS = {
+    "candidates": [3, 5, 10, 20],
+    "voters": [1000, 10000, 100000],
+    "unique": [100, 1000, 5000],
+    "seats": [1, 3, 5],
+}
+QUICK_SWEEPS = {
+    "candidates": [3, 10],
+    "voters": [1000, 10000],
+    "unique": [100, 1000],
+    "seats": [1, 3],
+}
+# Long rankings over a wide field: most ballots rank each winner, so process_election's incremental
+# tally has to keep up with recounting every seat from scratch
+LONG_ELECTION = {"candidates": 30, "voters": 2000000, "unique": 20000, "seats": 9}
+QUICK_LONG_ELECTION = {"candidates": 20, "voters": 200000, "unique": 5000, "seats": 5}
+# Corpus runner: number of small elections per run
+CORPUS_SIZES = [100, 1000]
+QUICK_CORPUS_SIZES = [100]
+CORPUS_ELECTION = {"candidates": 4, "voters": 100, "unique": 24}
+# Small election tabulated from a fresh interpreter to time start-up
+ROOT = os.path.dirname(os.path.abspath(__file__))
+COLD_START_ELECTION = os.path.join(ROOT, "Tests", "test.csv")
+# Fast calls are looped until a timed run lasts at least this long
+MIN_RUN_SECONDS = 0.05
+
+def arguments():
+    '''Get command line arguments'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output-file", dest="output", default="benchmark_results.json")
+    parser.add_argument("-c", "--compare", dest="compare", help="baseline results file to compare against")
+    parser.add_argument("-t", "--threshold", dest="threshold", default=0.25, type=float,
+                        help="fractional slowdown counted as a regression")
+    parser.add_argument("-r", "--repeat", dest="repeat", default=5, type=int)
+    parser.add_argument("-s", "--seed", dest="seed", default=0, type=int)
+    parser.add_argument("-b", "--backend", dest="backend", default="python")
+    parser.add_argument("-q", "--quick", dest="quick", action="store_true", help="smaller sweeps")
+    return parser.parse_args()
+
+def make_election(candidates, voters, unique, seed):
+    '''Generate a single election as a {ranking: votes} dict'''
+    random.seed(seed)
+    rankings = generate_unique_rankings(unique, candidates, 1, candidates, voters)
+    return {tuple(ranking): votes for ranking, votes in generate_ballots(voters, rankings)}
+
+def candidates_of(ballots):
+    return list(dict.fromkeys(candidate for ranking in ballots for candidate in ranking))
+
+def timed(function, repeat):
+    '''Best and median seconds per call over repeat runs, each looping until MIN_RUN_SECONDS, with the last return value'''
+    times = []
+    loops = 1
+    for _ in range(repeat):
+        while True:
+            start = time.perf_counter()
+            for _ in range(loops):
+                value = function()
+            elapsed = time.perf_counter() - start
+            if elapsed >= MIN_RUN_SECONDS or times:
+                break
+            loops *= 2
+        times.append(elapsed / loops)
+    return min(times), statistics.median(times), value
+
+def round_counters(ballots, candidates, backend):
+    '''Alpha iterations and pairs evaluated for the first round'''
+    trace = ElectionTrace()
+    process_round(ballots, candidates, last_round=True, verbose=False, backend=backend, trace=trace)
+    stats = trace.rounds[0]
+    return {"alpha_iterations": stats.alpha_steps, "pairs_evaluated": stats.pairs_compared,
+            "round_winner_found": stats.winner is not None, "final_alpha": stats.alpha}
+
+def bench_election(params, repeat, seed, backend):
+    '''Time the engine entry points on one generated election'''
+    ballots = make_election(params["candidates"], params["voters"], params["unique"], seed)
+    candidates = candidates_of(ballots)
+    seats = min(params["seats"], len(candidates))
+    counters = round_counters(ballots, candidates, backend)
+    results = []
+
+    best, median, winner = timed(lambda: process_round(ballots, candidates, last_round=True, verbose=False, backend=backend), repeat)
+    results.append({"name": "process_round", "params": params, "seconds": best, "median": median, **counters})
+
+    best, median, winners = timed(lambda: process_election(ballots, seats, 0.01, backend), repeat)
+    results.append({"name": "process_election", "params": params, "seconds": best, "median": median,
+                    "winners": [str(w) for w in winners]})
+
+    if winner not in (None, (None, None)):
+        best, median, _ = timed(lambda: recalculate_ballots(ballots, winner, counters["final_alpha"]), repeat)
+        results.append({"name": "recalculate_ballots", "params": params, "seconds": best, "median": median})
+    return results
+
+def recount_election(ballots, seats, alpha, backend):
+    '''Multi-winner election rebuilt every seat with process_round, as process_election did before its incremental tally'''
+    winners = []
+    for i in range(seats):
+        candidates = candidates_of(ballots)
+        if i == seats - 1:
+            winners.append(process_round(ballots, candidates, alpha, last_round=True, verbose=False, backend=backend))
+            break
+        winner, ballots = process_round(ballots, candidates, alpha, verbose=False, backend=backend)
+        winners.append(winner)
+        if winner is None:
+            break
+    return winners
+
+def bench_long_rankings(params, repeat, seed, backend):
+    '''Time process_election against recounting every seat on long rankings'''
+    ballots = make_election(params["candidates"], params["voters"], params["unique"], seed)
+    best, median, winners = timed(lambda: process_election(ballots, params["seats"], 0.01, backend), repeat)
+    recount_best, recount_median, _ = timed(lambda: recount_election(ballots, params["seats"], 0.01, backend), repeat)
+    return [{"name": "process_election_long", "params": params, "seconds": best, "median": median,
+             "winners": [str(w) for w in winners], "vs_recount": best / recount_best if recount_best else None},
+            {"name": "recount_election_long", "params": params, "seconds": recount_best, "median": recount_median}]
+
+def bench_corpus(size, repeat, seed):
+    '''Time the shared_main corpus runner on generated elections'''
+    random.seed(seed)
+    elections = []
+    for _ in range(size):
+        rankings = generate_unique_rankings(CORPUS_ELECTION["unique"], CORPUS_ELECTION["candidates"], 1,
+                                            CORPUS_ELECTION["candidates"], CORPUS_ELECTION["voters"])
+        ballots = generate_ballots(CORPUS_ELECTION["voters"], rankings)
+        elections.append(Election([Ballot(tuple(ranking), votes) for ranking, votes in ballots], {}))
+    params = {**CORPUS_ELECTION, "elections": size}
+    best, median, _ = timed(lambda: do_elections("elections_test", elections_test, False, False, elections, False), repeat)
+    return {"name": "corpus", "params": params, "seconds": best, "median": median,
+            "elections_per_second": size / best if best else None}
+
+def bench_cold_start(repeat):
+    '''Time a whole single tabulation through cli.py, interpreter start-up and imports included'''
+    command = [sys.executable, os.path.join(ROOT, "cli.py"), "tabulate", "-e", COLD_START_ELECTION]
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return {"name": "cold_start", "params": {"election": os.path.basename(COLD_START_ELECTION)},
+            "seconds": min(times), "median": statistics.median(times)}
+
+def run(args):
+    sweeps = QUICK_SWEEPS if args.quick else SWEEPS
+    results = []
+    seen = set()
+    for dimension, values in sweeps.items():
+        for value in values:
+            params = {**BASE, dimension: value}
+            key = json.dumps(params, sort_keys=True)
+            if key in seen:
+                continue
+            seen.add(key)
+            print("election " + key, file=sys.stderr)
+            results += bench_election(params, args.repeat, args.seed, args.backend)
+    long_election = QUICK_LONG_ELECTION if args.quick else LONG_ELECTION
+    print("long rankings " + json.dumps(long_election, sort_keys=True), file=sys.stderr)
+    results += bench_long_rankings(long_election, args.repeat, args.seed, args.backend)
+    for size in (QUICK_CORPUS_SIZES if args.quick else CORPUS_SIZES):
+        print("corpus " + str(size), file=sys.stderr)
+        results.append(bench_corpus(size, args.repeat, args.seed))
+    print("cold start", file=sys.stderr)
+    results.append(bench_cold_start(args.repeat))
+    return {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "seed": args.seed,
+                 "repeat": args.repeat, "backend": args.backend, "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+
+def result_key(result):
+    return result["name"] + " " + json.dumps(result["params"], sort_keys=True)
+
+def compare(report, baseline, threshold):
+    '''Print timing ratios against a baseline and return the keys that regressed'''
+    previous = {result_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        key = result_key(result)
+        if key not in previous:
+            print("NEW        " + key)
+            continue
+        ratio = result["seconds"] / previous[key]["seconds"] if previous[key]["seconds"] else float("inf")
+        status = "REGRESSION" if ratio > 1 + threshold else "ok"
+        if status == "REGRESSION":
+            regressions.append(key)
+        print(f"{status:10} {ratio:6.2f}x {key}")
+    return regressions
+
+def main():
+    args = arguments()
+    report = run(args)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=4)
+    print("Wrote " + args.output, file=sys.stderr)
+    if args.compare is not None:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(str(len(regressions)) + " regression(s) over " + str(int(args.threshold * 100)) + "%")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import importlib
+import sys
+
+'''
+Single entry point for the command line tools
+Each subcommand imports only the module it runs, so a tabulation does not load the corpus runner,
+the generator or matplotlib. Arguments after the subcommand are passed to that tool unchanged.
+'''
+
+# Subcommand: (module, entry point, description)
+COMMANDS = {
+    "tabulate": ("voting_system", "main", "count a ballot CSV, or several with --multi (voting_system.py)"),
+    "convert": ("Elections.convert", "convert", "convert a cast-vote record to ballot CSV (Elections/convert.py)"),
+    "generate": ("generator", "main", "generate random elections (generator.py)"),
+    "corpus": ("main", "main", "run the scheme over an election or corpus file (main.py)"),
+    "compare": ("common.compare", "main", "compare Hayden's method with IRV, Borda and Condorcet (common/compare.py)"),
+    "visualize": ("visualize", "main", "plot tie rates against the alpha cap (visualize.py)"),
+}
+
+def usage():
+    lines = ["usage: cli.py COMMAND [ARGS...]", "", "commands:"]
+    lines += [f"  {name:10} {description}" for name, (_, _, description) in COMMANDS.items()]
+    lines += ["", "Run cli.py COMMAND --help for the options of a command."]
+    return "\n".join(lines)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return
+    if argv[0] not in COMMANDS:
+        print(usage(), file=sys.stderr)
+        sys.exit("unknown command " + argv[0])
+    module, entry, _ = COMMANDS[argv[0]]
+    # Subcommand help and errors name the subcommand
+    sys.argv = ["cli.py " + argv[0]] + argv[1:]
+    getattr(importlib.import_module(module), entry)(argv[1:])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+'''
+Result cache keyed by canonical ballot profile.
+Elections that differ only by candidate labels or ballot order share a key: candidates are relabeled by
+a permutation-invariant signature and the relabeled ballots sorted before hashing. Results are stored in
+canonical labels and mapped back to each caller's candidates on a hit. An LRU tier lives in memory and
+an optional SQLite file shares results across runs.
+'''
+import hashlib
+import pickle
+import sqlite3
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable
+
+# Pending disk writes before a commit
+COMMIT_EVERY = 1000
+
+
+class Slot(int):
+    '''Candidate position in a canonical labeling, distinguishing candidates from other values in a result'''
+
+
+def canonical_profile(ballots: Iterable[tuple[tuple[Hashable, ...], float]]) -> tuple[str, list[Hashable]]:
+    '''
+    Digest of the ballot multiset under a canonical candidate labeling, and the candidates in canonical order.
+    Candidates are ordered by the sorted (rank, ranking length, count) of every ballot ranking them, then by
+    repr; isomorphic elections whose candidates tie on signature may get different digests (a miss, never a
+    wrong hit, since the digest covers the full relabeled profile).
+    Ballots are only sorted when every ranking is distinct: a repeated ranking is collapsed last-wins into a
+    {ranking: votes} dict by elections_test, so such a profile keeps its ballot order in the digest.
+    '''
+    ballots = list(ballots)
+    signatures: dict[Hashable, list] = {}
+    for ranking, count in ballots:
+        for rank, candidate in enumerate(ranking):
+            signatures.setdefault(candidate, []).append((rank, len(ranking), count))
+    labels = sorted(signatures, key=lambda candidate: (sorted(signatures[candidate]), repr(candidate)))
+    slots = {candidate: i for i, candidate in enumerate(labels)}
+    canonical = [(tuple(slots[candidate] for candidate in ranking), count) for ranking, count in ballots]
+    if len({ranking for ranking, _ in canonical}) == len(canonical):
+        canonical.sort()
+    return hashlib.sha256(repr(canonical).encode()).hexdigest(), labels
+
+
+def encode(value: Any, slots: dict[Hashable, int]) -> Any:
+    '''Replace candidate labels in a result with canonical Slots'''
+    if isinstance(value, (list, tuple)):
+        return type(value)(encode(v, slots) for v in value)
+    if value is None or isinstance(value, bool) or value not in slots:
+        return value
+    return Slot(slots[value])
+
+
+def decode(value: Any, labels: list[Hashable]) -> Any:
+    '''Map canonical Slots in a result back to candidate labels'''
+    if isinstance(value, (list, tuple)):
+        return type(value)(decode(v, labels) for v in value)
+    if isinstance(value, Slot):
+        return labels[value]
+    return value
+
+
+class ResultCache:
+    '''LRU memory tier in front of an optional on-disk SQLite tier, with hit and miss counters'''
+
+    def __init__(self, maxsize: int = 65536, path: str | None = None):
+        self.maxsize = maxsize
+        self.entries: OrderedDict[str, Any] = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.pending = 0
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path)
+            self.db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB)")
+
+    def key(self, ballots: Iterable[tuple[tuple[Hashable, ...], float]], params: tuple) -> tuple[str, list[Hashable]]:
+        '''Cache key for a profile evaluated with the given parameters (scheme, alpha, seats, ...)'''
+        digest, labels = canonical_profile(ballots)
+        return hashlib.sha256((digest + repr(params)).encode()).hexdigest(), labels
+
+    def get(self, key: str, labels: list[Hashable]) -> tuple[bool, Any]:
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, decode(self.entries[key], labels)
+        if self.db is not None:
+            row = self.db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.disk_hits += 1
+                value = pickle.loads(row[0])
+                self.remember(key, value)
+                return True, decode(value, labels)
+        self.misses += 1
+        return False, None
+
+    def put(self, key: str, labels: list[Hashable], result: Any):
+        value = encode(result, {candidate: i for i, candidate in enumerate(labels)})
+        self.remember(key, value)
+        if self.db is not None:
+            self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?)", (key, pickle.dumps(value)))
+            self.pending += 1
+            if self.pending >= COMMIT_EVERY:
+                self.flush()
+
+    def remember(self, key: str, value: Any):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def lookup(self, ballots: Iterable[tuple[tuple[Hashable, ...], float]], params: tuple, compute: Callable[[], Any]) -> Any:
+        '''Cached result for this profile and parameters, calling compute() on a miss'''
+        ballots = list(ballots)
+        key, labels = self.key(ballots, params)
+        found, result = self.get(key, labels)
+        if not found:
+            result = compute()
+            self.put(key, labels, result)
+        return result
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+        }
+
+    def flush(self):
+        if self.db is not None:
+            self.db.commit()
+            self.pending = 0
+
+    def close(self):
+        self.flush()
+        if self.db is not None:
+            self.db.close()
+            self.db = None
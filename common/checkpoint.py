@@ -0,0 +1,80 @@
+'''
+Checkpointed corpus runs.
+A ResultLog appends each finished election's winner to a JSON-lines file as soon as it is known, so an
+interrupted run restarts from where it stopped instead of from the beginning, and results never pile up in
+memory waiting for a final write. Once every election is done, the log is merged into a fresh pass over the input.
+'''
+import json
+import os
+from typing import Hashable, Iterable, Iterator
+
+from .types import Election
+
+# Records between fsyncs, bounding what a power loss (rather than a crash) can lose
+SYNC_EVERY = 1000
+
+
+class ResultLog:
+    '''
+    Append-only log of one scheme's winners over one input file.
+    The first line identifies the run; each later line is {"index": i, "winner": w}. Every line is flushed
+    as it is written, and a line torn by a crash is dropped when the log is reopened.
+    '''
+
+    def __init__(self, path: str, source: str, name: str, elections: int):
+        self.path = path
+        self.done: dict[int, Hashable] = {}
+        self.pending = 0
+        header = {"source": os.path.abspath(source), "name": name, "elections": elections}
+        if os.path.exists(path):
+            self.load(header)
+        else:
+            with open(path, "w") as f:
+                f.write(json.dumps(header) + "\n")
+        self.f = open(path, "a")
+
+    def load(self, header: dict):
+        with open(self.path, "rb") as f:
+            first = f.readline()
+            try:
+                found = json.loads(first)
+            except ValueError:
+                found = None
+            if found != header:
+                raise ValueError(f"Result log {self.path} was written for a different run: {first.decode().strip()}")
+            end = f.tell()
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                record = json.loads(line)
+                self.done[record["index"]] = record["winner"]
+                end += len(line)
+        # Drop a torn last line so new records start on a line of their own
+        os.truncate(self.path, end)
+
+    def record(self, index: int, winner: Hashable):
+        self.done[index] = winner
+        self.f.write(json.dumps({"index": index, "winner": winner}) + "\n")
+        self.f.flush()
+        self.pending += 1
+        if self.pending >= SYNC_EVERY:
+            os.fsync(self.f.fileno())
+            self.pending = 0
+
+    def complete(self, elections: int) -> bool:
+        return len(self.done) == elections
+
+    def applied(self, elections: Iterable[Election], name: str) -> Iterator[Election]:
+        '''Elections with every logged winner set, one at a time'''
+        for index, election in enumerate(elections):
+            if index in self.done:
+                election.winners[name] = self.done[index]
+            yield election
+
+    def close(self):
+        if not self.f.closed:
+            self.f.close()
+
+    def remove(self):
+        self.close()
+        os.remove(self.path)
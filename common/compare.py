@@ -0,0 +1,200 @@
+'''
+Several schemes over one pass of a corpus.
+Each election is loaded once and wrapped in a Preferences object, whose shared structures (candidate list,
+first preferences, the pairwise matrix) are computed the first time a scheme asks for them. Hayden's method and
+plain Condorcet read the same matrix, and IRV starts from the shared first preferences, so adding baselines to
+a run costs little more than the extra schemes' own counting.
+'''
+import argparse
+import json
+import sys
+import time
+from functools import cached_property
+from typing import Callable, Hashable, Iterable
+
+from .pairwise import PairwiseTally, build_tally
+from .shared_main import parallel_results
+from .store import BallotStore, read_source
+from .types import Ballot, BallotProfile, Election, Result
+from .utility import iter_elections
+
+# Alpha Hayden's method starts from, as in elections_test
+BASE_ALPHA = 0.01
+
+
+class Preferences:
+    '''One election's ballots with the structures schemes share, each built on first use'''
+
+    def __init__(self, ballots: Iterable[Ballot] | BallotProfile):
+        # Same conversion as elections_test, so every scheme sees the ballots Hayden's method does
+        if isinstance(ballots, BallotProfile):
+            self.ballots = dict(ballots.items())
+        else:
+            self.ballots = {ballot.ranking: ballot.tally for ballot in ballots}
+        self.candidates = list(dict.fromkeys(candidate for ranking in self.ballots for candidate in ranking))
+
+    @cached_property
+    def tally(self) -> PairwiseTally:
+        return build_tally(self.ballots, self.candidates)
+
+    @cached_property
+    def first_preferences(self) -> dict[Hashable, float]:
+        counts = dict.fromkeys(self.candidates, 0)
+        for ranking, votes in self.ballots.items():
+            # An empty ranking expresses no preference
+            if ranking:
+                counts[ranking[0]] += votes
+        return counts
+
+
+def unique_top(scores: dict[Hashable, float]) -> Result:
+    '''Highest-scoring candidate, or no winner if the top score is shared or nobody is ranked'''
+    if not scores:
+        return None, False
+    best = max(scores.values())
+    top = [candidate for candidate, score in scores.items() if score == best]
+    return (top[0], True) if len(top) == 1 else (None, False)
+
+
+def hayden(preferences: Preferences) -> Result:
+    '''Single-winner Hayden's method, identical to elections_test'''
+    winner, _ = preferences.tally.resolve(BASE_ALPHA)
+    return (preferences.candidates[winner], True) if winner is not None else (None, False)
+
+
+def condorcet(preferences: Preferences) -> Result:
+    '''Candidate winning every head-to-head on plain votes (a ranked candidate beats an unranked one)'''
+    votes = preferences.tally.votes
+    size = len(preferences.candidates)
+    for candidate in range(size):
+        if all(votes[candidate][opponent] > votes[opponent][candidate] for opponent in range(size) if opponent != candidate):
+            return preferences.candidates[candidate], True
+    return None, False
+
+
+def borda(preferences: Preferences) -> Result:
+    '''Borda count: C - 1 points for a first choice down to 0, and nothing for unranked candidates'''
+    size = len(preferences.candidates)
+    scores = dict.fromkeys(preferences.candidates, 0)
+    for ranking, votes in preferences.ballots.items():
+        for rank, candidate in enumerate(ranking):
+            scores[candidate] += votes * (size - 1 - rank)
+    return unique_top(scores)
+
+
+def irv(preferences: Preferences) -> Result:
+    '''Instant runoff: eliminate the last-placed candidate until one holds a majority of continuing votes'''
+    counts = dict(preferences.first_preferences)
+    if not counts:
+        return None, False
+    while True:
+        leader = max(counts, key=counts.get)
+        if len(counts) == 1 or 2 * counts[leader] > sum(counts.values()):
+            return leader, True
+        lowest = min(counts.values())
+        last = [candidate for candidate, count in counts.items() if count == lowest]
+        if len(last) > 1:
+            # Elimination order would be arbitrary
+            return None, False
+        counts = dict.fromkeys((candidate for candidate in counts if candidate != last[0]), 0)
+        for ranking, votes in preferences.ballots.items():
+            for candidate in ranking:
+                if candidate in counts:
+                    counts[candidate] += votes
+                    break
+
+
+SCHEMES: dict[str, Callable[[Preferences], Result]] = {
+    "elections_test": hayden,
+    "irv": irv,
+    "borda": borda,
+    "condorcet": condorcet,
+}
+
+
+class SchemeSet:
+    '''Scheme returning the results of several schemes over shared Preferences, so it runs on the corpus worker pool'''
+
+    def __init__(self, names: list[str]):
+        for name in names:
+            if name not in SCHEMES:
+                raise ValueError(f"Unknown scheme {name}")
+        self.names = list(names)
+
+    def __call__(self, ballots: list[Ballot] | BallotProfile) -> tuple[Result, ...]:
+        preferences = Preferences(ballots)
+        return tuple(SCHEMES[name](preferences) for name in self.names)
+
+
+def outcome(result: Result) -> Hashable:
+    '''Winner as do_election reports it'''
+    return result[0] if result[1] else "<AMBIGUOUS>"
+
+
+def compare_elections(elections: Iterable[Election], names: list[str], jobs: int = 1) -> dict:
+    '''
+    Run every named scheme on every election and summarize: decisive results per scheme, the number of elections
+    on which each pair of schemes agrees (same winner, or both ambiguous), and disagreements with stored winners.
+    '''
+    schemes = SchemeSet(names)
+    if jobs > 1:
+        results = parallel_results(schemes, elections, jobs)
+    else:
+        results = ((election, schemes(election.ballots)) for election in elections)
+    count = 0
+    decisive = dict.fromkeys(names, 0)
+    agreement = {a: dict.fromkeys(names, 0) for a in names}
+    mismatches = dict.fromkeys(names, 0)
+    for election, outcomes in results:
+        count += 1
+        winners = [outcome(result) for result in outcomes]
+        for a, winner in zip(names, winners):
+            decisive[a] += winner != "<AMBIGUOUS>"
+            if a in election.winners and election.winners[a] != winner:
+                mismatches[a] += 1
+            for b, other in zip(names, winners):
+                agreement[a][b] += winner == other
+    return {"elections": count, "decisive": decisive, "agreement": agreement, "mismatches": mismatches}
+
+
+def print_report(report: dict):
+    names = list(report["decisive"])
+    width = max(len(name) for name in names) + 2
+    label = max(width, len("stored mismatches")) + 2
+    print(f"{report['elections']} elections")
+    print("decisive".ljust(label) + "".join(f"{report['decisive'][name]:>{width}}" for name in names))
+    print("stored mismatches".ljust(label) + "".join(f"{report['mismatches'][name]:>{width}}" for name in names))
+    print()
+    print("agreement".ljust(label) + "".join(f"{name:>{width}}" for name in names))
+    for a in names:
+        print(a.ljust(label) + "".join(f"{report['agreement'][a][b] / max(1, report['elections']):>{width}.3f}" for b in names))
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="compare voting schemes over the same elections")
+    parser.add_argument("input", type=str, help="corpus, elections or election JSON file, ballot CSV, or binary store")
+    parser.add_argument("--schemes", nargs="+", default=list(SCHEMES), choices=list(SCHEMES))
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes")
+    parser.add_argument("--output", type=str, help="write the report as JSON")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.input.endswith(".bin"):
+        with BallotStore(args.input) as store:
+            report = compare_elections(store, args.schemes, args.jobs)
+    elif args.input.endswith(".csv"):
+        elections, _ = read_source(args.input)
+        report = compare_elections(elections, args.schemes, args.jobs)
+    else:
+        # Streamed, so a corpus is compared at constant memory
+        with open(args.input, "r") as f:
+            report = compare_elections(iter_elections(f), args.schemes, args.jobs)
+    print_report(report)
+    print(f"{time.perf_counter() - start:.2f}s", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+'''
+Fixed-point counting.
+Vote weights are integers in units of 2 ** -WEIGHT_BITS votes and alpha is the exact decimal it was written as,
+so every pairwise sum is an integer, points are compared exactly, and the alpha cap is met by exact equality.
+Integer sums do not depend on summation order, so results are bit-identical across platforms, backends and
+shardings. The only rounding is in reweighting, which rounds each new weight down to a whole unit.
+'''
+from fractions import Fraction
+from typing import Hashable
+
+from .types import BallotProfile
+
+# Fraction bits of a weight: 2 ** -20 is just under a millionth of a vote
+WEIGHT_BITS = 20
+
+
+def fixed_alpha(alpha: float | str | Fraction) -> Fraction:
+    '''Alpha as the exact decimal it was written as, so 0.01 is 1/100 rather than the nearest binary float'''
+    return alpha if isinstance(alpha, Fraction) else Fraction(str(alpha))
+
+
+def fixed_weight(votes: float) -> int:
+    '''Votes in whole units of 2 ** -WEIGHT_BITS, rounded to the nearest unit'''
+    if isinstance(votes, int):
+        return votes << WEIGHT_BITS
+    return round(Fraction(votes) * (1 << WEIGHT_BITS))
+
+
+def fixed_ballots(ballots: dict | BallotProfile) -> dict:
+    '''{ranking: weight in units}, summing repeated rankings'''
+    fixed: dict[tuple[Hashable, ...], int] = {}
+    for ranking, votes in ballots.items():
+        fixed[ranking] = fixed.get(ranking, 0) + fixed_weight(votes)
+    return fixed
+
+
+def fixed_reweight(weight: int, distance: int, alpha: Fraction) -> int:
+    '''weight / (1 + distance * alpha), rounded down to a whole unit'''
+    return weight * alpha.denominator // (alpha.denominator + distance * alpha.numerator)
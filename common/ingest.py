@@ -0,0 +1,127 @@
+'''
+Streaming ballot ingestion.
+Rows are read one at a time, candidate names are interned to small integer IDs and identical
+rankings are aggregated as they arrive, so memory grows with the number of distinct rankings
+rather than the number of rows or the size of the strings in them.
+'''
+import sys
+from typing import Callable, Iterable, Iterator
+
+# Cast-vote record entries that do not name a candidate
+SKIP_TOKENS = frozenset({"skipped", "Undeclared", "overvote", "Write-in"})
+
+# Rows between progress reports
+PROGRESS_EVERY = 100000
+
+Progress = Callable[[int], None]
+
+
+class CandidateTable:
+    '''Interns candidate names to small integer IDs, in order of first appearance'''
+
+    def __init__(self):
+        self.names: list[str] = []
+        self.ids: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def intern(self, name: str) -> int:
+        candidate = self.ids.get(name)
+        if candidate is None:
+            candidate = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return candidate
+
+    def decode(self, ranking: Iterable[int]) -> tuple[str, ...]:
+        return tuple(self.names[candidate] for candidate in ranking)
+
+    def decode_ballots(self, ballots: dict) -> dict:
+        return {self.decode(ranking): votes for ranking, votes in ballots.items()}
+
+
+def print_progress(rows: int):
+    print(f"\rread {rows} rows", end="", file=sys.stderr, flush=True)
+
+
+def read_ballots_csv(lines: Iterable[str], table: CandidateTable, progress: Progress | None = None) -> dict:
+    '''
+    Stream "count,first,second,..." rows into {ranking of candidate IDs: count}.
+    Rows without a ranking (blank lines or an empty first choice) are skipped.
+    '''
+    ballots = {}
+    rows = 0
+    for rows, line in enumerate(lines, 1):
+        split = line.strip().split(",")
+        if len(split) < 2 or split[1] == "":
+            continue
+        ranking = tuple(table.intern(candidate) for candidate in split[1:])
+        ballots[ranking] = ballots.get(ranking, 0) + int(split[0])
+        if progress is not None and rows % PROGRESS_EVERY == 0:
+            progress(rows)
+    if progress is not None:
+        progress(rows)
+    return ballots
+
+
+def read_elections_csv(lines: Iterable[str], progress: Progress | None = None) -> Iterator[dict]:
+    '''
+    Stream a file of several elections, as written by generator.py, one election at a time.
+    Elections are runs of "count,first,second,..." rows separated by blank lines; each is yielded as
+    {ranking of candidate names: count} once its last row is read, so only one election is held in memory.
+    '''
+    table = CandidateTable()
+    ballots = {}
+    rows = 0
+    for rows, line in enumerate(lines, 1):
+        split = line.strip().split(",")
+        if split == [""]:
+            if ballots:
+                yield table.decode_ballots(ballots)
+                table, ballots = CandidateTable(), {}
+            continue
+        if len(split) < 2 or split[1] == "":
+            continue
+        ranking = tuple(table.intern(candidate) for candidate in split[1:])
+        ballots[ranking] = ballots.get(ranking, 0) + int(split[0])
+        if progress is not None and rows % PROGRESS_EVERY == 0:
+            progress(rows)
+    if ballots:
+        yield table.decode_ballots(ballots)
+    if progress is not None:
+        progress(rows)
+
+
+def clean_ranking(fields: Iterable[str], table: CandidateTable) -> tuple[int, ...]:
+    '''Drop quotes, skipped/overvote/write-in entries and repeated choices in one pass'''
+    seen = set()
+    ranking = []
+    for field in fields:
+        name = field.replace('"', "").strip()
+        if name == "" or name in SKIP_TOKENS:
+            continue
+        candidate = table.intern(name)
+        if candidate not in seen:
+            seen.add(candidate)
+            ranking.append(candidate)
+    return tuple(ranking)
+
+
+def read_cvr(lines: Iterable[str], first: int, table: CandidateTable, progress: Progress | None = None) -> dict:
+    '''
+    Stream a cast-vote record export (one header row, then one row per voter with ranks starting
+    at column `first`) into {ranking of candidate IDs: count}. Blank ballots are dropped.
+    '''
+    lines = iter(lines)
+    next(lines, None)
+    ballots = {}
+    rows = 0
+    for rows, line in enumerate(lines, 1):
+        ranking = clean_ranking(line.split(",")[first:], table)
+        if ranking:
+            ballots[ranking] = ballots.get(ranking, 0) + 1
+        if progress is not None and rows % PROGRESS_EVERY == 0:
+            progress(rows)
+    if progress is not None:
+        progress(rows)
+    return ballots
@@ -0,0 +1,498 @@
+import math
+import sys
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from fractions import Fraction
+from itertools import chain
+from typing import Hashable, Iterable, Iterator
+
+from .fixed import fixed_reweight
+from .trace import RoundTrace
+from .types import BallotProfile
+
+# Rank stored for a candidate that does not appear on a ballot
+NOT_RANKED = -1
+
+# One entry per distinct ranking: (candidate slot -> rank, votes)
+PositionIndex = list[tuple[list[int], float]]
+
+
+def slot_rankings(ballots: dict | BallotProfile, candidates: list[Hashable]) -> Iterator[tuple[list[int | None], float]]:
+    '''(candidate slots in ranked order, votes) for every ranking; None marks a candidate not in the list'''
+    slots = {candidate: i for i, candidate in enumerate(candidates)}
+    if isinstance(ballots, BallotProfile):
+        # Map the profile's candidate IDs straight to slots instead of rebuilding label tuples
+        remap = [slots.get(candidate) for candidate in ballots.candidates]
+        return (([remap[c] for c in ballots.ids(b)], votes) for b, votes in enumerate(ballots.weights))
+    return (([slots.get(candidate) for candidate in ranking], votes) for ranking, votes in ballots.items())
+
+
+def position_index(ballots: dict | BallotProfile, candidates: list[Hashable]) -> PositionIndex:
+    '''
+    Build a dense candidate -> rank lookup for every distinct ranking, in ballot order.
+    Slot i of each lookup holds the rank of candidates[i] on that ballot, or NOT_RANKED.
+    Built once so filling the pairwise tally needs no list searches.
+    '''
+    index = []
+    for ranking, votes in slot_rankings(ballots, candidates):
+        positions = [NOT_RANKED] * len(candidates)
+        for rank, slot in enumerate(ranking):
+            # Keep the first occurrence, matching ranking.index()
+            if slot is not None and positions[slot] == NOT_RANKED:
+                positions[slot] = rank
+        index.append((positions, votes))
+    return index
+
+
+# Alpha at which doubling stops and the round is declared a tie
+MAX_ALPHA = 10.24
+
+# Relative float error under which PairwiseTally.window treats a margin as possibly positive
+ANALYTIC_ERROR = 16 * sys.float_info.epsilon
+
+
+class PairwiseTally:
+    '''
+    Alpha-parametric Condorcet matrix.
+    Every distance-modified tally is linear in alpha, so the points of candidates[i] against candidates[j]
+    are votes[i][j] + alpha * weighted[i][j], where votes holds the plain votes won in that pairing
+    and weighted the distance-weighted votes. Both are filled in one pass over the ballots,
+    after which any alpha is scored in O(C^2) with no further ballot scans.
+    A fixed-point tally holds integer sums and is scored at exact Fraction alphas (see common.fixed).
+    '''
+
+    def __init__(self, candidates: list[Hashable], fixed_point: bool = False):
+        self.candidates = list(candidates)
+        self.fixed_point = fixed_point
+        size = len(self.candidates)
+        self.votes = [[0] * size for _ in range(size)]
+        self.weighted = [[0] * size for _ in range(size)]
+
+    @classmethod
+    def from_index(cls, index: PositionIndex, candidates: list[Hashable]) -> "PairwiseTally":
+        tally = cls(candidates)
+        slots = range(len(tally.candidates))
+        for positions, votes in index:
+            for i in slots:
+                rank = positions[i]
+                if rank == NOT_RANKED:
+                    continue
+                votes_row = tally.votes[i]
+                weighted_row = tally.weighted[i]
+                for j in slots:
+                    opponent_rank = positions[j]
+                    if opponent_rank == NOT_RANKED:
+                        # Ranked over an absent opponent counts as distance 1
+                        votes_row[j] += votes
+                        weighted_row[j] += votes
+                    elif opponent_rank > rank:
+                        votes_row[j] += votes
+                        weighted_row[j] += votes * (opponent_rank - rank)
+        return tally
+
+    def subset(self, slots: list[int]) -> "PairwiseTally":
+        '''Tally restricted to the given candidate slots, in that order'''
+        tally = PairwiseTally([self.candidates[i] for i in slots], self.fixed_point)
+        tally.votes = [[self.votes[i][j] for j in slots] for i in slots]
+        tally.weighted = [[self.weighted[i][j] for j in slots] for i in slots]
+        return tally
+
+    def points(self, candidate: int, opponent: int, alpha: float) -> float:
+        return self.votes[candidate][opponent] + alpha * self.weighted[candidate][opponent]
+
+    def window(self, candidate: int, alphas: list[float]) -> range:
+        '''
+        Indices of the increasing alphas at which candidate may beat every opponent.
+        Each margin is linear in alpha, so the alphas where it is not surely negative form an interval, and so
+        does their intersection over all opponents. In float mode a margin counts as surely negative only below
+        ANALYTIC_ERROR times its operands, which also covers the rounding in finding the interval's ends, so no
+        alpha at which the float comparisons could crown candidate is left out.
+        '''
+        votes, weighted = self.votes, self.weighted
+        error = 0 if self.fixed_point else ANALYTIC_ERROR
+        low, high = 0, math.inf
+        for opponent in range(len(self.candidates)):
+            if opponent == candidate:
+                continue
+            ahead, behind = votes[candidate][opponent], votes[opponent][candidate]
+            weighted_ahead, weighted_behind = weighted[candidate][opponent], weighted[opponent][candidate]
+            if ahead == behind and weighted_ahead == weighted_behind:
+                # Identical sides score identical points, so neither ever beats the other
+                return range(0)
+            intercept = ahead - behind + error * (abs(ahead) + abs(behind))
+            slope = weighted_ahead - weighted_behind + error * (abs(weighted_ahead) + abs(weighted_behind))
+            if slope == 0:
+                if intercept <= 0:
+                    return range(0)
+                continue
+            root = Fraction(-intercept, slope) if self.fixed_point else -intercept / slope
+            if slope > 0:
+                low = max(low, root)
+            else:
+                high = min(high, root)
+            if low >= high or low >= alphas[-1] or high <= alphas[0]:
+                # No alpha left, so the remaining opponents need not be looked at
+                return range(0)
+        first = bisect_right(alphas, low)
+        return range(first, max(first, bisect_left(alphas, high)))
+
+    def winner(self, alpha: float, stats: RoundTrace | None = None, contenders: Iterable[int] | None = None) -> int | None:
+        '''
+        Slot of the candidate beating every opponent at this alpha, or None.
+        Only the given contenders are tried (every candidate by default), and a candidate beaten by an earlier
+        one this step is skipped, since at most one candidate can win.
+        '''
+        size = len(self.candidates)
+        compared = 0
+        found = None
+        beaten = set()
+        for candidate in range(size) if contenders is None else contenders:
+            if candidate in beaten:
+                continue
+            for opponent in range(size):
+                if opponent == candidate:
+                    continue
+                compared += 1
+                if not self.points(candidate, opponent, alpha) > self.points(opponent, candidate, alpha):
+                    break
+                beaten.add(opponent)
+            else:
+                found = candidate
+                break
+        if stats is not None:
+            stats.pairs_compared += compared
+            if found is not None and compared < size * (size - 1):
+                stats.early_stops += 1
+        return found
+
+    def resolve(self, alpha: float, max_alpha: float = MAX_ALPHA, stats: RoundTrace | None = None) -> tuple[int | None, float]:
+        '''
+        Double alpha until a round winner emerges, as process_round always has.
+        Returns the winner slot (None on a tie) and alpha after the final doubling,
+        which is the alpha recalculate_ballots reweights with.
+        The doublings are listed up front and, unless the first one decides the round, each candidate's window of
+        steps it could win is found from the sums. Only steps inside some window are scored, so a round nobody
+        can win is a tie after one look at the matrix instead of a full comparison at every doubling.
+        '''
+        # A lone candidate wins without any head-to-head
+        if len(self.candidates) == 1:
+            return 0, alpha
+        if self.fixed_point and not reaches(alpha, max_alpha):
+            # Exact alphas never overflow to infinity, so the cap is the only way out
+            raise ValueError(f"Alpha cap {max_alpha} is not reached by doubling alpha {alpha}")
+        alphas = []
+        while alpha != max_alpha and not math.isinf(alpha):
+            alphas.append(alpha)
+            alpha *= 2
+        if not alphas:
+            return None, alpha
+        # Most rounds are decided at the first alpha, which needs no windows
+        winner = self.winner(alphas[0], stats)
+        if winner is not None:
+            if stats is not None:
+                stats.alpha_steps += 1
+            return winner, alphas[0] * 2
+        windows = [self.window(candidate, alphas) for candidate in range(len(self.candidates))]
+        for step in sorted(set().union(*windows) - {0}):
+            winner = self.winner(alphas[step], stats, [candidate for candidate, window in enumerate(windows) if step in window])
+            if winner is not None:
+                if stats is not None:
+                    stats.alpha_steps += step + 1
+                return winner, alphas[step] * 2
+        if stats is not None:
+            stats.alpha_steps += len(alphas)
+        return None, alpha
+
+    def margins(self, alpha: float) -> list[tuple[Hashable, Hashable, float]]:
+        '''Points difference for every head-to-head at this alpha'''
+        return [
+            (self.candidates[i], self.candidates[j], self.points(i, j, alpha) - self.points(j, i, alpha))
+            for i in range(len(self.candidates))
+            for j in range(i + 1, len(self.candidates))
+        ]
+
+
+def reaches(alpha: float, max_alpha: float) -> bool:
+    '''Whether doubling alpha lands exactly on max_alpha, the only way resolve() stops short of infinity'''
+    return 0 < alpha <= max_alpha and max_alpha == alpha * 2 ** round(math.log2(max_alpha / alpha))
+
+
+# Engines that can fill a PairwiseTally
+BACKENDS = ("python", "numpy", "parallel", "sparse")
+
+
+def build_tally(
+    ballots: dict | BallotProfile, candidates: list[Hashable], backend: str = "python", fixed_point: bool = False
+) -> PairwiseTally:
+    '''
+    Fill a PairwiseTally with the chosen engine; the numpy and parallel backends are imported only when requested.
+    A fixed-point tally needs integer weights and an engine that sums them exactly.
+    '''
+    if backend == "python":
+        tally = PairwiseTally.from_index(position_index(ballots, candidates), candidates)
+        tally.fixed_point = fixed_point
+        return tally
+    if backend == "numpy":
+        if fixed_point:
+            raise ValueError("Fixed-point counting needs the python, parallel or sparse backend")
+        from .pairwise_numpy import tally_numpy
+
+        return tally_numpy(ballots, candidates)
+    if backend == "parallel":
+        from .pairwise_parallel import tally_parallel
+
+        return tally_parallel(ballots, candidates, fixed_point)
+    if backend == "sparse":
+        return tally_sparse(ballots, candidates, fixed_point)
+    raise ValueError(f"Unknown backend {backend}")
+
+
+# Every finite float is an integer multiple of 2 ** -EXACT_BITS
+EXACT_BITS = 1074
+EXACT_SCALE = 1 << EXACT_BITS
+
+
+def fraction_bits(weight: float) -> int:
+    '''Fewest bits after the binary point that hold weight exactly'''
+    if isinstance(weight, int):
+        return 0
+    return weight.as_integer_ratio()[1].bit_length() - 1
+
+
+def exact(weight: float, bits: int = EXACT_BITS) -> int:
+    '''Weight as an exact integer count of 2 ** -bits units, for bits at least fraction_bits(weight)'''
+    if isinstance(weight, int):
+        return weight << bits
+    numerator, denominator = weight.as_integer_ratio()
+    return numerator << (bits - denominator.bit_length() + 1)
+
+
+class PairwiseComponents:
+    '''
+    Pairwise tallies kept as per-candidate row totals plus ranked-vs-ranked sums.
+    A ballot ranking i but not j counts as distance 1 for i, so for i != j
+        votes[i][j]    = ranked[i] - above[j][i]
+        weighted[i][j] = ranked[i] - above[i][j] - above[j][i] + spread[i][j]
+    where ranked[i] sums ballots ranking i, above[i][j] those ranking i over j and spread[i][j] the same
+    weighted by distance. Ballots ranking both of a pair make up above[i][j] + above[j][i], so unranked
+    opponents are credited through the row totals and adding a ballot costs O(L^2) in its length, not O(C^2).
+    Sums are kept as exact fixed-point integers in units of 2 ** -bits, so removing a ballot cancels its
+    earlier addition exactly and equal tallies stay equal however the updates were ordered. bits only grows
+    as finer weights arrive, so the integers stay as short as the weights allow.
+    '''
+
+    def __init__(self, size: int, bits: int = EXACT_BITS):
+        self.bits = bits
+        self.ranked = [0] * size
+        self.above = [[0] * size for _ in range(size)]
+        self.spread = [[0] * size for _ in range(size)]
+
+    def refine(self, bits: int):
+        '''Keep the sums in units of 2 ** -bits from now on, if that is finer than the current units'''
+        if bits <= self.bits:
+            return
+        shift = bits - self.bits
+        self.ranked = [total << shift for total in self.ranked]
+        self.above = [[total << shift for total in row] for row in self.above]
+        self.spread = [[total << shift for total in row] for row in self.spread]
+        self.bits = bits
+
+    def add(self, ranking: list[int], weight: float):
+        '''Add one ballot of candidate slots (a negative weight removes it); weight must fit in the current units'''
+        self.add_units(ranking, exact(weight, self.bits))
+
+    def add_units(self, ranking: list[int], weight: int):
+        '''Add one ballot whose weight is already an integer count of fixed-point units; None slots are skipped'''
+        positions = {}
+        for rank, slot in enumerate(ranking):
+            if slot is not None:
+                positions.setdefault(slot, rank)
+        # Insertion order is rank order, so every later entry is ranked below the current one
+        ranked = list(positions.items())
+        for a, (slot, rank) in enumerate(ranked):
+            self.ranked[slot] += weight
+            above_row, spread_row = self.above[slot], self.spread[slot]
+            for opponent, opponent_rank in ranked[a + 1 :]:
+                above_row[opponent] += weight
+                spread_row[opponent] += weight * (opponent_rank - rank)
+
+    def merge(self, other: "PairwiseComponents", shift: int = 0):
+        '''Add another set of sums, kept in units 2 ** shift times larger than these'''
+        for i in range(len(self.ranked)):
+            self.ranked[i] += other.ranked[i] << shift
+            for mine, theirs in ((self.above, other.above), (self.spread, other.spread)):
+                row, other_row = mine[i], theirs[i]
+                for j in range(len(row)):
+                    if other_row[j]:
+                        row[j] += other_row[j] << shift
+
+    def add_to(self, tally: PairwiseTally, slots: list[int]):
+        '''Add these sums to a tally whose candidates are the given slots, in order'''
+        shift = EXACT_BITS - self.bits
+        for a, i in enumerate(slots):
+            votes_row, weighted_row = tally.votes[a], tally.weighted[a]
+            ranked, above_row, spread_row = self.ranked[i], self.above[i], self.spread[i]
+            for b, j in enumerate(slots):
+                if i == j:
+                    continue
+                unopposed = ranked - above_row[j] - self.above[j][i]
+                if unopposed or above_row[j] or spread_row[j]:
+                    votes = exact(votes_row[b]) + ((unopposed + above_row[j]) << shift)
+                    weighted = exact(weighted_row[b]) + ((unopposed + spread_row[j]) << shift)
+                    if tally.fixed_point:
+                        # Integer weights are whole multiples of the scale
+                        votes_row[b], weighted_row[b] = votes >> EXACT_BITS, weighted >> EXACT_BITS
+                    else:
+                        votes_row[b], weighted_row[b] = votes / EXACT_SCALE, weighted / EXACT_SCALE
+
+
+def sparse_components(rankings: Iterable[tuple[list[int | None], float]], size: int) -> tuple[int, PairwiseComponents]:
+    '''
+    Sums of (slots, votes) ballots in units of 2 ** -bits, with bits the finest any of their weights needs.
+    Whole vote counts need no fraction bits, so a first round adds small integers.
+    '''
+    rankings = [(ranking, votes.as_integer_ratio()) for ranking, votes in rankings]
+    bits = max((denominator.bit_length() - 1 for _, (_, denominator) in rankings), default=0)
+    components = PairwiseComponents(size, bits)
+    for ranking, (numerator, denominator) in rankings:
+        components.add_units(ranking, numerator << (bits - denominator.bit_length() + 1))
+    return bits, components
+
+
+def components_tally(
+    parts: Iterable[tuple[int, PairwiseComponents]], candidates: list[Hashable], fixed_point: bool = False
+) -> PairwiseTally:
+    '''PairwiseTally of the sum of (bits, components) parts, rounded once'''
+    components = PairwiseComponents(len(candidates))
+    for bits, part in parts:
+        components.merge(part, EXACT_BITS - bits)
+    tally = PairwiseTally(candidates, fixed_point)
+    components.add_to(tally, list(range(len(candidates))))
+    return tally
+
+
+def tally_sparse(ballots: dict | BallotProfile, candidates: list[Hashable], fixed_point: bool = False) -> PairwiseTally:
+    '''
+    Fill a PairwiseTally visiting only the candidates each ballot ranks.
+    Costs O(L^2) per ballot of length L plus O(C^2) once, instead of the python backend's O(L * C) per ballot,
+    so truncated ballots in large fields are cheap. Sums are exact, as in the parallel backend.
+    '''
+    return components_tally([sparse_components(slot_rankings(ballots, candidates), len(candidates))], candidates, fixed_point)
+
+
+# Share of the live ballots an elected winner may touch before IncrementalTally recounts instead of updating
+REBUILD_FRACTION = 0.5
+
+
+class IncrementalTally:
+    '''
+    Pairwise matrix kept for a whole multi-winner election instead of being rebuilt every seat.
+    The matrix is a sum of per-ballot contributions, so electing a winner only removes and re-adds
+    the ballots that ranked the winner (reduced and reweighted exactly as recalculate_ballots does)
+    and drops single-choice ballots. Those changes are accumulated as PairwiseComponents on top of the
+    first round's matrix, so each touched ballot costs O(L^2) and every other ballot is left alone.
+    A touched ballot costs about as much as recounting one, so a winner ranked on most live ballots
+    is applied by recounting them instead, merging rankings that become equal as recalculate_ballots does.
+    In fixed-point mode the weights are integer units and reweighting rounds down (see common.fixed).
+    '''
+
+    def __init__(self, ballots: dict | BallotProfile, backend: str = "python", fixed_point: bool = False):
+        self.backend = backend
+        self.fixed_point = fixed_point
+        if isinstance(ballots, BallotProfile):
+            # Profile IDs are already slots in order of first appearance
+            self.candidates = list(ballots.candidates)
+            self.load([list(ballots.ids(b)) for b in range(len(ballots))], list(ballots.weights))
+        else:
+            self.candidates = []
+            slots = {}
+            for ranking in ballots:
+                for candidate in ranking:
+                    if candidate not in slots:
+                        slots[candidate] = len(self.candidates)
+                        self.candidates.append(candidate)
+            self.load([[slots[candidate] for candidate in ranking] for ranking in ballots], list(ballots.values()))
+        self.tally = build_tally(ballots, self.candidates, backend, fixed_point)
+        self.changes = PairwiseComponents(len(self.candidates), 0)
+
+    def load(self, rankings: list[list[int]], weights: list[float]):
+        '''Take rankings of candidate slots and their weights as the live ballots'''
+        self.rankings = rankings
+        self.weights = weights
+        # Times each slot is ranked on a live ballot, live ballots with a single choice, and live ballots
+        self.holders = Counter(chain.from_iterable(rankings))
+        self.singles = sum(len(ranking) == 1 for ranking in rankings)
+        self.live = len(rankings)
+
+    def remaining(self) -> list[int]:
+        '''Slots of candidates still ranked on some live ballot, in order of first appearance'''
+        return [slot for slot in range(len(self.candidates)) if self.holders[slot] > 0]
+
+    def round_tally(self) -> PairwiseTally:
+        slots = self.remaining()
+        tally = self.tally.subset(slots)
+        self.changes.add_to(tally, slots)
+        return tally
+
+    def reweight(self, ranking: list[int], weight: float, winner: int, alpha: float) -> float:
+        '''Weight of a ballot once winner is removed from it, as in recalculate_ballots'''
+        distance = len(ranking) - ranking.index(winner)
+        if self.fixed_point:
+            return fixed_reweight(weight, distance, alpha)
+        return weight / (1 + distance * alpha)
+
+    def elect(self, winner: Hashable, alpha: float) -> int:
+        '''Apply recalculate_ballots(ballots, winner, alpha) to the matrix, returning the ballots scanned'''
+        winner = self.candidates.index(winner)
+        # At least as many ballots as the winner's and the single-choice ones together
+        if self.holders[winner] + self.singles > REBUILD_FRACTION * self.live:
+            return self.recount(winner, alpha)
+        touched = [
+            b for b, ranking in enumerate(self.rankings) if ranking is not None and (len(ranking) == 1 or winner in ranking)
+        ]
+        updates = []
+        for b in touched:
+            ranking, weight = self.rankings[b], self.weights[b]
+            self.holders.subtract(ranking)
+            if len(ranking) == 1:
+                self.singles -= 1
+                updates.append((b, ranking, weight, None, weight))
+                continue
+            reduced = [slot for slot in ranking if slot != winner]
+            updates.append((b, ranking, weight, reduced, self.reweight(ranking, weight, winner, alpha)))
+        # Units fine enough for every weight removed or added, so the updates stay exact
+        self.changes.refine(max((max(fraction_bits(old), fraction_bits(new)) for _, _, old, _, new in updates), default=0))
+        for b, ranking, weight, reduced, new_weight in updates:
+            self.changes.add(ranking, -weight)
+            self.rankings[b], self.weights[b] = reduced, new_weight
+            if reduced is None:
+                self.live -= 1
+                continue
+            self.changes.add(reduced, new_weight)
+            self.holders.update(reduced)
+            self.singles += len(reduced) == 1
+        return len(touched)
+
+    def recount(self, winner: int, alpha: float) -> int:
+        '''Apply the election to every live ballot and count the matrix afresh, returning the ballots scanned'''
+        ballots = {}
+        for ranking, weight in zip(self.rankings, self.weights):
+            if ranking is None or len(ranking) == 1:
+                continue
+            if winner in ranking:
+                weight = self.reweight(ranking, weight, winner, alpha)
+                ranking = [slot for slot in ranking if slot != winner]
+            ranking = tuple(ranking)
+            ballots[ranking] = ballots.get(ranking, 0) + weight
+        scanned = self.live
+        self.load([list(ranking) for ranking in ballots], list(ballots.values()))
+        # Counted with the remaining slots as candidates, then spread back out to every slot
+        slots = self.remaining()
+        counted = build_tally(ballots, slots, self.backend, self.fixed_point)
+        self.tally = PairwiseTally(self.candidates, self.fixed_point)
+        for a, i in enumerate(slots):
+            votes_row, weighted_row = self.tally.votes[i], self.tally.weighted[i]
+            for b, j in enumerate(slots):
+                votes_row[j], weighted_row[j] = counted.votes[a][b], counted.weighted[a][b]
+        self.changes = PairwiseComponents(len(self.candidates), 0)
+        return scanned
@@ -0,0 +1,55 @@
+from typing import Hashable
+
+import numpy as np
+
+from .pairwise import NOT_RANKED, PairwiseTally
+from .types import BallotProfile
+
+# Ballot rows per batch, keeping the (rows x C x C) temporaries to a few million cells
+BATCH_CELLS = 1 << 22
+
+
+def encode_ballots(ballots: dict | BallotProfile, candidates: list[Hashable]) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Encode ballots as a padded (B x C) int16 rank matrix plus a float64 weight vector.
+    ranks[b][i] is the rank of candidates[i] on ballot b, or NOT_RANKED.
+    '''
+    slots = {candidate: i for i, candidate in enumerate(candidates)}
+    ranks = np.full((len(ballots), len(candidates)), NOT_RANKED, dtype=np.int16)
+    weights = np.empty(len(ballots), dtype=np.float64)
+    for b, (ranking, votes) in enumerate(ballots.items()):
+        row = ranks[b]
+        # Reversed so the first occurrence of a repeated candidate wins, matching ranking.index()
+        for rank in range(len(ranking) - 1, -1, -1):
+            slot = slots.get(ranking[rank])
+            if slot is not None:
+                row[slot] = rank
+        weights[b] = votes
+    return ranks, weights
+
+
+def tally_numpy(ballots: dict | BallotProfile, candidates: list[Hashable]) -> PairwiseTally:
+    '''
+    Fill a PairwiseTally with batched NumPy operations instead of nested Python loops.
+    For each batch, diff[b, i, j] = rank of j - rank of i; candidate i wins the pairing on
+    ballot b if i is ranked and j is either absent (distance 1) or ranked below i.
+    '''
+    ranks, weights = encode_ballots(ballots, candidates)
+    size = len(candidates)
+    votes = np.zeros((size, size), dtype=np.float64)
+    weighted = np.zeros((size, size), dtype=np.float64)
+    step = max(1, BATCH_CELLS // max(1, size * size))
+    for start in range(0, len(weights), step):
+        batch = ranks[start : start + step].astype(np.int32)
+        batch_weights = weights[start : start + step]
+        ranked = batch != NOT_RANKED
+        diff = batch[:, None, :] - batch[:, :, None]
+        absent = ~ranked[:, None, :]
+        wins = ranked[:, :, None] & (absent | (diff > 0))
+        distance = np.where(absent, 1, diff) * wins
+        votes += np.einsum("b,bij->ij", batch_weights, wins)
+        weighted += np.einsum("b,bij->ij", batch_weights, distance)
+    tally = PairwiseTally(candidates)
+    tally.votes = votes.tolist()
+    tally.weighted = weighted.tolist()
+    return tally
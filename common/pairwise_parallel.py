@@ -0,0 +1,130 @@
+'''
+Pairwise tallies of one large election split across worker processes.
+Ballots are encoded once into a shared-memory block (choice offsets, weights and candidate slots), so workers
+attach by name instead of receiving pickled ballots. Each worker sums its shard into exact fixed-point
+PairwiseComponents and the shards are reduced by adding them, so the tally is the same however many workers
+there are, and equals the exact sums rounded once rather than accumulated in float.
+'''
+import atexit
+import os
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Hashable, Sequence
+
+from .pairwise import PairwiseComponents, PairwiseTally, components_tally, sparse_components
+from .types import BallotProfile
+
+# Elections with fewer ranked choices than this are tallied in-process
+PARALLEL_MIN_CHOICES = 1 << 16
+
+# Worker processes for the parallel backend; os.cpu_count() when None
+jobs: int | None = None
+executor: ProcessPoolExecutor | None = None
+
+
+def configure(workers: int | None):
+    '''Set the number of worker processes, replacing any running pool'''
+    global jobs
+    jobs = workers
+    shutdown()
+
+
+def shutdown():
+    global executor
+    if executor is not None:
+        executor.shutdown()
+        executor = None
+
+
+def workers() -> int:
+    return jobs or os.cpu_count() or 1
+
+
+def pool() -> ProcessPoolExecutor:
+    '''Worker pool kept across elections and rounds, so election-night runs pay process start-up once'''
+    global executor
+    if executor is None:
+        executor = ProcessPoolExecutor(workers())
+    return executor
+
+
+atexit.register(shutdown)
+
+
+def encode_ballots(ballots: dict | BallotProfile, candidates: list[Hashable]) -> tuple[array, array, array]:
+    '''Choice offsets (B + 1), weights (B) and concatenated candidate slots of every ballot'''
+    if isinstance(ballots, BallotProfile) and ballots.candidates == list(candidates):
+        # Already in this layout
+        return ballots.offsets, ballots.weights, ballots.choices
+    slots = {candidate: i for i, candidate in enumerate(candidates)}
+    offsets, weights, choices = array("q", [0]), array("d"), array("i")
+    for ranking, votes in ballots.items():
+        choices.extend(slots[candidate] for candidate in ranking if candidate in slots)
+        offsets.append(len(choices))
+        weights.append(votes)
+    return offsets, weights, choices
+
+
+def shard_components(
+    offsets: Sequence[int], weights: Sequence[float], choices: Sequence[int], size: int, start: int, stop: int
+) -> tuple[int, PairwiseComponents]:
+    '''Sums of ballots start..stop, as sparse_components'''
+    return sparse_components(
+        ((list(choices[offsets[b] : offsets[b + 1]]), weights[b]) for b in range(start, stop)), size
+    )
+
+
+def shared_shard(name: str, ballots: int, size: int, start: int, stop: int) -> tuple[int, PairwiseComponents]:
+    '''Worker entry point: attach to the encoded ballots and sum one shard'''
+    block = shared_memory.SharedMemory(name=name)
+    views = []
+    try:
+        buffer = block.buf
+        offsets = buffer[: 8 * (ballots + 1)].cast("q")
+        weights = buffer[8 * (ballots + 1) : 8 * (2 * ballots + 1)].cast("d")
+        choices = buffer[8 * (2 * ballots + 1) : 8 * (2 * ballots + 1) + 4 * offsets[ballots]].cast("i")
+        views = [offsets, weights, choices]
+        return shard_components(offsets, weights, choices, size, start, stop)
+    finally:
+        for view in views:
+            view.release()
+        block.close()
+
+
+def shard_bounds(offsets: Sequence[int], shards: int) -> list[int]:
+    '''Ballot indices splitting the election into shards with about the same number of choices'''
+    ballots = len(offsets) - 1
+    bounds = [0]
+    for k in range(1, shards):
+        bounds.append(max(bounds[-1], min(ballots, bisect_left(offsets, offsets[ballots] * k // shards))))
+    bounds.append(ballots)
+    return bounds
+
+
+def tally_parallel(ballots: dict | BallotProfile, candidates: list[Hashable], fixed_point: bool = False) -> PairwiseTally:
+    '''Fill a PairwiseTally from shards summed in worker processes; fixed-point weights must stay below 2 ** 53'''
+    size = len(candidates)
+    offsets, weights, choices = encode_ballots(ballots, candidates)
+    if len(choices) < PARALLEL_MIN_CHOICES:
+        parts = [shard_components(offsets, weights, choices, size, 0, len(weights))]
+    else:
+        block = shared_memory.SharedMemory(create=True, size=8 * len(offsets) + 8 * len(weights) + 4 * len(choices))
+        try:
+            start = 0
+            for section in (offsets, weights, choices):
+                data = memoryview(section).cast("B")
+                block.buf[start : start + len(data)] = data
+                start += len(data)
+            bounds = shard_bounds(offsets, workers())
+            futures = [
+                pool().submit(shared_shard, block.name, len(weights), size, bounds[k], bounds[k + 1])
+                for k in range(len(bounds) - 1)
+                if bounds[k] < bounds[k + 1]
+            ]
+            parts = [future.result() for future in futures]
+        finally:
+            block.close()
+            block.unlink()
+    return components_tally(parts, candidates, fixed_point)
@@ -0,0 +1,174 @@
+'''
+Opt-in profiling of counts and corpus runs.
+A RunProfile adds up wall-clock time per phase (parse, unmarshal, tabulate, reweight, write), keeps the slowest
+elections, and can run the whole job under cProfile, saving pstats output and collapsed stacks that flamegraph
+tools render. Callers only create one when --profile (or a profile output file) is given, so ordinary runs pay
+nothing: every hook below is skipped behind an `is None` check.
+'''
+import argparse
+import contextlib
+import heapq
+import sys
+import time
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, TextIO
+
+if TYPE_CHECKING:
+    import pstats
+
+# Phases in report order; trace phases of a count are folded into them
+PHASES = ("parse", "unmarshal", "tabulate", "reweight", "write")
+TRACE_PHASES = {"tally": "tabulate", "resolve": "tabulate", "reweight": "reweight"}
+
+# Slowest elections listed in the report
+TOP_N = 10
+
+# Collapsed stacks carrying less time than this (in seconds) are dropped, bounding the paths walked
+MIN_STACK_TIME = 1e-6
+
+
+class RunProfile:
+    '''Phase totals, per-election timings and an optional cProfile run'''
+
+    def __init__(self, top: int = TOP_N, stats_file: str | None = None, collapsed_file: str | None = None):
+        self.top = top
+        self.stats_file = stats_file
+        self.collapsed_file = collapsed_file
+        self.phases: dict[str, float] = {}
+        self.elections = 0
+        self.election_seconds = 0.0
+        # Min-heap of (seconds, index, ballots), so only the top N are kept however long the run
+        self.slowest: list[tuple[float, int, int]] = []
+        self.profiler = None
+        if stats_file or collapsed_file:
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+        self.started = time.perf_counter()
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> "RunProfile | None":
+        if not (args.profile or args.profile_stats or args.profile_collapsed):
+            return None
+        return cls(args.profile_top, args.profile_stats, args.profile_collapsed)
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def timed(self, name: str, items: Iterable) -> Iterator:
+        '''Iterate items, charging the time spent producing each one to a phase'''
+        items = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                self.add(name, time.perf_counter() - start)
+                return
+            self.add(name, time.perf_counter() - start)
+            yield item
+
+    def election(self, index: int, ballots: int, seconds: float):
+        self.elections += 1
+        self.election_seconds += seconds
+        entry = (seconds, index, ballots)
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, entry)
+        elif self.top > 0 and entry > self.slowest[0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def emit(self, record: dict[str, Any]):
+        '''Trace sink: fold a round's phase timings into the run's phases'''
+        for name, seconds in record["timings"].items():
+            self.add(TRACE_PHASES.get(name, name), seconds)
+
+    def __enter__(self) -> "RunProfile":
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.finish()
+
+    def finish(self, out: TextIO = sys.stderr):
+        '''Print the report and write the profiler outputs'''
+        total = time.perf_counter() - self.started
+        print(f"Profile: {total:.3f}s wall", file=out)
+        for name in [name for name in PHASES if name in self.phases] + [name for name in self.phases if name not in PHASES]:
+            print(f"  {name:<10} {self.phases[name]:10.3f}s {100 * self.phases[name] / max(total, 1e-9):6.1f}%", file=out)
+        if self.elections:
+            print(f"  {self.elections} elections, {1000 * self.election_seconds / self.elections:.3f}ms mean", file=out)
+            print(f"Slowest {len(self.slowest)} elections:", file=out)
+            for seconds, index, ballots in sorted(self.slowest, reverse=True):
+                print(f"  #{index:<8} {1000 * seconds:10.3f}ms  {ballots} ballots", file=out)
+        if self.profiler is None:
+            return
+        import pstats
+
+        stats = pstats.Stats(self.profiler, stream=out)
+        if self.stats_file:
+            stats.dump_stats(self.stats_file)
+            print(f"pstats written to {self.stats_file}", file=out)
+        if self.collapsed_file:
+            with open(self.collapsed_file, "w") as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in collapsed_stacks(stats))
+            print(f"Collapsed stacks written to {self.collapsed_file}", file=out)
+
+
+def phase(profile: RunProfile | None, name: str):
+    '''Timer for a phase of the run, or a no-op when not profiling'''
+    return contextlib.nullcontext() if profile is None else profile.phase(name)
+
+
+def frame_name(function: tuple[str, int, str]) -> str:
+    filename, line, name = function
+    if filename == "~":
+        # Built-ins are recorded as ("~", 0, "<built-in method ...>")
+        return name
+    return f"{name} ({filename.rsplit('/', 1)[-1]}:{line})"
+
+
+def collapsed_stacks(stats: "pstats.Stats") -> list[tuple[str, int]]:
+    '''
+    "root;caller;callee microseconds" lines for flamegraph.pl, speedscope and similar tools.
+    cProfile only records caller -> callee edges, so a function's own time is split across the paths leading
+    to it in proportion to the time each edge carried; recursion is cut where a function reappears on its path.
+    '''
+    entries = stats.stats  # type: ignore[attr-defined]
+    callees: dict[tuple, list[tuple[tuple, float]]] = {}
+    for function, (_, _, _, _, callers) in entries.items():
+        for caller, (_, _, _, cumulative) in callers.items():
+            callees.setdefault(caller, []).append((function, cumulative))
+    roots = [function for function, (_, _, _, _, callers) in entries.items() if not callers]
+    found: dict[str, float] = {}
+
+    def walk(function: tuple, path: tuple, names: str, share: float):
+        _, _, own, cumulative, _ = entries[function]
+        fraction = 1.0 if cumulative <= 0 else min(1.0, share / cumulative)
+        if own * fraction > 0:
+            found[names] = found.get(names, 0.0) + own * fraction
+        for callee, edge in callees.get(function, ()):
+            if callee not in path and edge * fraction >= MIN_STACK_TIME:
+                walk(callee, path + (callee,), names + ";" + frame_name(callee), edge * fraction)
+
+    for root in roots:
+        walk(root, (root,), frame_name(root), entries[root][3])
+    return [(stack, round(seconds * 1e6)) for stack, seconds in sorted(found.items()) if round(seconds * 1e6) > 0]
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--profile", action="store_true", help="report per-phase timings (summed over workers) and the slowest elections on stderr")
+    parser.add_argument("--profile-top", type=int, default=TOP_N, help="slowest elections to report")
+    parser.add_argument("--profile-stats", type=str, help="run under cProfile and write pstats output here (implies --profile)")
+    parser.add_argument(
+        "--profile-collapsed", type=str, help="run under cProfile and write collapsed stacks for flamegraphs here (implies --profile)"
+    )
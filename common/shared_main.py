@@ -1,60 +1,380 @@
 import argparse
-from typing import Hashable
+import contextlib
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Hashable, Iterable, Iterator
 
-from .types import Scheme, Election
+from .cache import ResultCache
+from .checkpoint import ResultLog
+from .profiling import RunProfile, add_profile_arguments, phase
+from .store import BallotStore, write_store
+from .types import Scheme, Election, Ballot, Result
 from .utility import (
-    read_corpus,
-    unmarshal_corpus,
-    unmarshal_elections,
+    ElectionsWriter,
+    iter_election_data,
+    iter_elections,
+    unmarshal_election,
     write_elections,
     read_election,
     pretty_election_json,
+    write_corpus_elections,
 )
 
 
+def stream_elections(
+    fname: str, header: dict[str, Any], profile: RunProfile | None = None
+) -> Iterator[Election]:
+    """Elections of a JSON file read one at a time, charging parse and unmarshal time when profiling"""
+    with open(fname, "r") as f:
+        if profile is None:
+            yield from iter_elections(f, header)
+            return
+        for data in profile.timed("parse", iter_election_data(f, header)):
+            with profile.phase("unmarshal"):
+                election = unmarshal_election(data)
+            yield election
+
+
+def count_json_elections(fname: str) -> int:
+    """Elections in a JSON file, parsed but never unmarshalled or profiled"""
+    with open(fname, "r") as f:
+        return sum(1 for _ in iter_election_data(f))
+
+
 def do_corpus_file(
-    fname: str, name: str, scheme: Scheme, check: bool, overwrite: bool, verbose: bool
+    fname: str,
+    name: str,
+    scheme: Scheme,
+    check: bool,
+    overwrite: bool,
+    verbose: bool,
+    jobs: int = 1,
+    cache: ResultCache | None = None,
+    log_file: str | None = None,
+    output: str | None = None,
+    profile: RunProfile | None = None,
 ):
-    with open(fname, "r") as f:
-        data = read_corpus(f)
-    corpus = unmarshal_corpus(data)
-    elections = corpus.elections
-    do_elections(name, scheme, check, overwrite, elections, verbose)
+    # Corpus fields around the elections array, filled in as the file is read
+    header: dict[str, Any] = {}
+
+    def elections(profile: RunProfile | None) -> Iterator[Election]:
+        return stream_elections(fname, header, profile)
+
+    def write(target: str, finished: Iterable[Election]):
+        with phase(profile, "write"), open(target, "w") as f:
+            write_corpus_elections(header, finished, f)
+
+    if log_file is not None:
+        run_logged(
+            fname,
+            name,
+            scheme,
+            check,
+            overwrite,
+            elections,
+            count_json_elections(fname),
+            verbose,
+            jobs,
+            cache,
+            log_file,
+            output,
+            write,
+            profile,
+        )
+        return
+    do_elections(name, scheme, check, overwrite, elections(profile), verbose, jobs, cache, profile=profile)
 
 
 def do_elections_file(
-    fname: str, name: str, scheme: Scheme, check: bool, overwrite: bool, verbose: bool
+    fname: str,
+    name: str,
+    scheme: Scheme,
+    check: bool,
+    overwrite: bool,
+    verbose: bool,
+    jobs: int = 1,
+    cache: ResultCache | None = None,
+    log_file: str | None = None,
+    output: str | None = None,
+    profile: RunProfile | None = None,
 ):
-    with open(fname, "r") as f:
-        data = read_corpus(f)
-    elections = unmarshal_elections(data)
-    do_elections(name, scheme, check, overwrite, elections, verbose)
-    if overwrite:
-        with open(fname, "w") as f:
-            write_elections(elections, f)
+    def elections(profile: RunProfile | None) -> Iterator[Election]:
+        return stream_elections(fname, {}, profile)
+
+    def write(target: str, finished: Iterable[Election]):
+        with phase(profile, "write"), open(target, "w") as f:
+            write_elections(finished, f)
+
+    if log_file is not None:
+        run_logged(
+            fname,
+            name,
+            scheme,
+            check,
+            overwrite,
+            elections,
+            count_json_elections(fname),
+            verbose,
+            jobs,
+            cache,
+            log_file,
+            output,
+            write,
+            profile,
+        )
+        return
+    if not overwrite:
+        do_elections(name, scheme, check, overwrite, elections(profile), verbose, jobs, cache, profile=profile)
+        return
+    # Each election is written out as soon as it is counted, and the result replaces the input at the end
+    with open(fname + ".tmp", "w") as f:
+        writer = ElectionsWriter(f)
+        do_elections(
+            name, scheme, check, overwrite, elections(profile), verbose, jobs, cache, profile=profile, finished=writer.write
+        )
+        writer.close()
+    os.replace(fname + ".tmp", fname)
+
+
+def do_store_file(
+    fname: str,
+    name: str,
+    scheme: Scheme,
+    check: bool,
+    overwrite: bool,
+    verbose: bool,
+    jobs: int = 1,
+    cache: ResultCache | None = None,
+    log_file: str | None = None,
+    output: str | None = None,
+    profile: RunProfile | None = None,
+):
+    with BallotStore(fname) as store:
+
+        def elections(profile: RunProfile | None) -> Iterable[Election]:
+            # Elections are decoded from the mapped file as they are reached, never all held at once
+            return store if profile is None else profile.timed("unmarshal", store)
+
+        if log_file is not None:
+
+            def write(target: str, finished: Iterable[Election]):
+                with phase(profile, "write"), open(target, "wb") as f:
+                    write_store(finished, f, store.corpus or None)
+
+            run_logged(
+                fname,
+                name,
+                scheme,
+                check,
+                overwrite,
+                elections,
+                len(store),
+                verbose,
+                jobs,
+                cache,
+                log_file,
+                output,
+                write,
+                profile,
+            )
+            return
+        if not overwrite:
+            do_elections(name, scheme, check, overwrite, elections(profile), verbose, jobs, cache, profile=profile)
+            return
+        # The store is rewritten with the new winners, so the counted elections are kept until then
+        counted: list[Election] = []
+        do_elections(
+            name, scheme, check, overwrite, elections(profile), verbose, jobs, cache, profile=profile, finished=counted.append
+        )
+        with phase(profile, "write"), open(fname + ".tmp", "wb") as f:
+            write_store(counted, f, store.corpus or None)
+    os.replace(fname + ".tmp", fname)
 
 
 def do_election_file(
-    fname: str, name: str, scheme: Scheme, check: bool, overwrite: bool, verbose: bool
+    fname: str,
+    name: str,
+    scheme: Scheme,
+    check: bool,
+    overwrite: bool,
+    verbose: bool,
+    profile: RunProfile | None = None,
 ):
-    with open(fname, "r") as f:
+    with phase(profile, "parse"), open(fname, "r") as f:
         election = read_election(f)
-    do_election(name, scheme, check, overwrite, election, verbose)
+    do_elections(name, scheme, check, overwrite, [election], verbose, profile=profile)
     if overwrite:
-        with open(fname, "w") as f:
+        with phase(profile, "write"), open(fname, "w") as f:
             write_elections([election], f)
 
 
+def run_logged(
+    fname: str,
+    name: str,
+    scheme: Scheme,
+    check: bool,
+    overwrite: bool,
+    elections: Callable[[RunProfile | None], Iterable[Election]],
+    count: int,
+    verbose: bool,
+    jobs: int,
+    cache: ResultCache | None,
+    log_file: str,
+    output: str | None,
+    write: Callable[[str, Iterable[Election]], None],
+    profile: RunProfile | None = None,
+):
+    """
+    Run with a result log: each election's winner is appended to log_file as it finishes and elections
+    already in the log are skipped, so an interrupted run picks up where it stopped. Once every election
+    is logged, the winners are merged and written to output (or back to fname with overwrite) and the
+    log is removed. count is the number of elections in the input, which identifies the run in the log.
+    elections(profile) starts a fresh pass over the input, so a streamed file is read once to run and once
+    more to merge, without ever being held in memory.
+    """
+    log = ResultLog(log_file, fname, name, count)
+    try:
+        do_elections(name, scheme, check, overwrite, elections(profile), verbose, jobs, cache, log, profile)
+    finally:
+        log.close()
+    target = output or (fname if overwrite else None)
+    if target is None or not log.complete(count):
+        return
+    # Not profiled, so the merge counts as writing rather than parsing
+    write(target + ".tmp", log.applied(elections(None), name))
+    os.replace(target + ".tmp", target)
+    log.remove()
+
+
+# Elections sent to a worker per task, amortizing pickling and scheduling
+CHUNK_SIZE = 64
+
+
 def do_elections(
     name: str,
     scheme: Scheme,
     check: bool,
     overwrite: bool,
-    elections: list[Election],
+    elections: Iterable[Election],
     verbose: bool,
+    jobs: int = 1,
+    cache: ResultCache | None = None,
+    log: ResultLog | None = None,
+    profile: RunProfile | None = None,
+    finished: Callable[[Election], None] | None = None,
 ):
-    for election in elections:
-        do_election(name, scheme, check, overwrite, election, verbose)
+    # Indices of the elections still to run; with a log, finished ones are skipped
+    indices: deque = deque()
+    # Seconds each election took to count, in the same order, when profiling
+    times: deque | None = None if profile is None else deque()
+
+    def todo() -> Iterator[Election]:
+        for index, election in enumerate(elections):
+            if log is None or index not in log.done:
+                indices.append(index)
+                yield election
+
+    def finish(election: Election, result: Result | None):
+        winner = do_election(name, scheme, check, overwrite, election, verbose, result)
+        index = indices.popleft()
+        if log is not None:
+            log.record(index, winner)
+        if times is not None:
+            seconds = times.popleft()
+            profile.add("tabulate", seconds)
+            profile.election(index, len(election.ballots), seconds)
+        if finished is not None:
+            with phase(profile, "write"):
+                finished(election)
+
+    if jobs > 1:
+        for election, result in parallel_results(scheme, todo(), jobs, cache, (name,), times):
+            finish(election, result)
+        return
+    for election in todo():
+        result = None
+        start = time.perf_counter() if times is not None else 0.0
+        if cache is not None:
+            result = cache.lookup(
+                election.ballots, (name,), lambda: scheme(election.ballots)
+            )
+        elif times is not None:
+            result = scheme(election.ballots)
+        if times is not None:
+            times.append(time.perf_counter() - start)
+        finish(election, result)
+
+
+def run_chunk(scheme: Scheme, chunk: list[list[Ballot]]) -> list[Result]:
+    return [scheme(ballots) for ballots in chunk]
+
+
+def run_chunk_timed(
+    scheme: Scheme, chunk: list[list[Ballot]]
+) -> list[tuple[Result, float]]:
+    results = []
+    for ballots in chunk:
+        start = time.perf_counter()
+        results.append((scheme(ballots), time.perf_counter() - start))
+    return results
+
+
+def parallel_results(
+    scheme: Scheme,
+    elections: Iterable[Election],
+    jobs: int,
+    cache: ResultCache | None = None,
+    params: tuple = (),
+    times: deque | None = None,
+) -> Iterator[tuple[Election, Result]]:
+    """
+    Shard elections across a process pool in chunks, yielding results in input order.
+    With a cache, hits are answered in this process and only misses are sent to workers.
+    With times, the seconds each worker spent on an election (0 for a cache hit) are appended to it
+    before the election is yielded.
+    """
+    elections = iter(elections)
+    with ProcessPoolExecutor(jobs) as pool:
+        # Keep a couple of chunks per worker in flight so memory stays bounded
+        pending: deque = deque()
+        while True:
+            chunk = list(islice(elections, CHUNK_SIZE))
+            if chunk:
+                ballots = [list(election.ballots) for election in chunk]
+                results: list = [None] * len(chunk)
+                keys: list = [None] * len(chunk)
+                if cache is not None:
+                    for i, election_ballots in enumerate(ballots):
+                        keys[i] = cache.key(election_ballots, params)
+                        found, results[i] = cache.get(*keys[i])
+                        if found:
+                            ballots[i] = None
+                misses = [i for i, b in enumerate(ballots) if b is not None]
+                future = pool.submit(
+                    run_chunk if times is None else run_chunk_timed,
+                    scheme,
+                    [ballots[i] for i in misses],
+                )
+                pending.append((chunk, results, keys, misses, future))
+            if pending and (not chunk or len(pending) >= 2 * jobs):
+                done, results, keys, misses, future = pending.popleft()
+                seconds = [0.0] * len(done)
+                for i, result in zip(misses, future.result()):
+                    if times is not None:
+                        result, seconds[i] = result
+                    results[i] = result
+                    if cache is not None:
+                        cache.put(*keys[i], result)
+                for election, result, spent in zip(done, results, seconds):
+                    if times is not None:
+                        times.append(spent)
+                    yield election, result
+            if not chunk and not pending:
+                return
 
 
 def do_election(
@@ -64,8 +384,10 @@ def do_election(
     overwrite: bool,
     election: Election,
     verbose: bool,
+    result: Result | None = None,
 ):
-    result = scheme(election.ballots)
+    if result is None:
+        result = scheme(election.ballots)
     winner: Hashable = result[0] if result[1] else "<AMBIGUOUS>"
     if verbose:
         pretty = pretty_election_json(election)
@@ -86,41 +408,122 @@ def do_election(
         print()
     if overwrite:
         election.winners[name] = winner
+    return winner
 
 
-def shared_main(name: str, scheme: Scheme):
-    args = parse_args()
+def shared_main(name: str, scheme: Scheme, argv: list[str] | None = None):
+    args = parse_args(argv)
     if args.alias:
         name = args.alias
+    cache = None
+    if args.cache or args.cache_file:
+        cache = ResultCache(args.cache_size, args.cache_file)
+    profile = RunProfile.from_args(args)
+    try:
+        with profile if profile is not None else contextlib.nullcontext():
+            run_files(args, name, scheme, cache, profile)
+    finally:
+        if cache is not None:
+            cache.close()
+            print(f"Cache: {cache.stats()}", file=sys.stderr)
+
+
+def run_files(
+    args: argparse.Namespace,
+    name: str,
+    scheme: Scheme,
+    cache,
+    profile: RunProfile | None = None,
+):
     if args.election:
         do_election_file(
-            args.election, name, scheme, args.check, args.overwrite, args.verbose
+            args.election,
+            name,
+            scheme,
+            args.check,
+            args.overwrite,
+            args.verbose,
+            profile,
         )
     elif args.elections:
         do_elections_file(
-            args.elections, name, scheme, args.check, args.overwrite, args.verbose
+            args.elections,
+            name,
+            scheme,
+            args.check,
+            args.overwrite,
+            args.verbose,
+            args.jobs,
+            cache,
+            args.log,
+            args.output,
+            profile,
         )
     elif args.corpus:
         do_corpus_file(
-            args.corpus, name, scheme, args.check, args.overwrite, args.verbose
+            args.corpus,
+            name,
+            scheme,
+            args.check,
+            args.overwrite,
+            args.verbose,
+            args.jobs,
+            cache,
+            args.log,
+            args.output,
+            profile,
+        )
+    elif args.store:
+        do_store_file(
+            args.store,
+            name,
+            scheme,
+            args.check,
+            args.overwrite,
+            args.verbose,
+            args.jobs,
+            cache,
+            args.log,
+            args.output,
+            profile,
         )
     else:
         raise ValueError("No input file specified")
 
 
-def parse_args():
+def parse_args(argv: list[str] | None = None):
     parser = argparse.ArgumentParser()
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument("--election", type=str, help="election file")
     group.add_argument("--elections", type=str, help="elections file")
     group.add_argument("--corpus", type=str, help="corpus file")
-    parser.add_argument("--output", type=str, help="output file")
+    group.add_argument("--store", type=str, help="binary ballot store file")
+    parser.add_argument("--output", type=str, help="output file for merged results of a --log run")
     parser.add_argument(
         "--overwrite", action="store_true", help="overwrite election values"
     )
     parser.add_argument("--verbose", action="store_true", help="print election values")
     parser.add_argument("--check", action="store_true", help="check election values")
     parser.add_argument("--alias", type=str, help="force new scheme name")
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="worker processes for corpus runs"
+    )
+    parser.add_argument(
+        "--cache", action="store_true", help="reuse results for equivalent elections"
+    )
+    parser.add_argument(
+        "--cache-size", type=int, default=65536, help="in-memory cache entries"
+    )
+    parser.add_argument(
+        "--cache-file", type=str, help="on-disk result cache shared across runs"
+    )
+    parser.add_argument(
+        "--log",
+        type=str,
+        help="append results to this log as elections finish and resume from it; "
+        "merged into --output (or the input with --overwrite) once complete",
+    )
+    add_profile_arguments(parser)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     return args
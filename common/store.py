@@ -0,0 +1,209 @@
+'''
+Compact binary ballot store.
+
+Layout (little-endian), after a fixed header:
+    election offsets  u64[E + 1]   index of each election's first ballot
+    ballot offsets    u64[B + 1]   index of each ballot's first choice
+    counts            i64[B]       tally of each ballot
+    winner offsets    u64[E + 1]   byte range of each election's winners JSON
+    choices           i32[N]       candidate IDs, ballot after ballot
+    candidates        JSON list    candidate label for each ID
+    corpus            JSON object  corpus header fields, if converted from a corpus
+    winners           bytes        concatenated winners JSON objects
+The reader memory-maps the file and builds Election/Ballot objects only when they are accessed.
+'''
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Any, Hashable, Iterable, Iterator, Sequence
+
+from .ingest import CandidateTable, read_ballots_csv
+from .types import Ballot, Election
+from .utility import elections_from_corpus, json_to_Election, unmarshal_elections
+
+MAGIC = b"HAYB"
+VERSION = 1
+# magic, version, elections, ballots, choices, candidates JSON bytes, corpus JSON bytes, winners bytes
+HEADER = struct.Struct("<4sIQQQQQQ")
+
+CORPUS_FIELDS = (
+    "num_candidates",
+    "num_voters",
+    "max_ranking_length",
+    "min_ranking_length",
+    "max_unique_rankings",
+)
+
+
+def write_store(elections: Iterable[Election], f, corpus: dict[str, Any] | None = None):
+    '''Encode elections into the binary store format on a binary file object'''
+    if sys.byteorder != "little":
+        raise ValueError("Ballot stores can only be written on little-endian hosts")
+    table: dict[Hashable, int] = {}
+    labels: list[Hashable] = []
+    election_offsets, ballot_offsets = array("Q", [0]), array("Q", [0])
+    counts, choices = array("q"), array("i")
+    winner_offsets, winners = array("Q", [0]), bytearray()
+    for election in elections:
+        for ballot in election.ballots:
+            for candidate in ballot.ranking:
+                if candidate not in table:
+                    table[candidate] = len(labels)
+                    labels.append(candidate)
+                choices.append(table[candidate])
+            ballot_offsets.append(len(choices))
+            counts.append(ballot.tally)
+        election_offsets.append(len(counts))
+        winners += json.dumps(election.winners, sort_keys=True).encode()
+        winner_offsets.append(len(winners))
+    candidates_json = json.dumps(labels).encode()
+    corpus_json = json.dumps(corpus or {}).encode()
+    f.write(
+        HEADER.pack(
+            MAGIC,
+            VERSION,
+            len(election_offsets) - 1,
+            len(counts),
+            len(choices),
+            len(candidates_json),
+            len(corpus_json),
+            len(winners),
+        )
+    )
+    for section in (election_offsets, ballot_offsets, counts, winner_offsets, choices):
+        section.tofile(f)
+    f.write(candidates_json)
+    f.write(corpus_json)
+    f.write(winners)
+
+
+class BallotsView(Sequence[Ballot]):
+    '''Lazy sequence of one election's ballots, decoded from the mapped arrays on access'''
+
+    def __init__(self, store: "BallotStore", start: int, stop: int):
+        self.store = store
+        self.start = start
+        self.stop = stop
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("ballot index out of range")
+        return self.store.ballot(self.start + i)
+
+    def __iter__(self) -> Iterator[Ballot]:
+        ballot = self.store.ballot
+        for b in range(self.start, self.stop):
+            yield ballot(b)
+
+
+class BallotStore(Sequence[Election]):
+    '''Memory-mapped reader for the binary ballot store'''
+
+    def __init__(self, fname: str):
+        if sys.byteorder != "little":
+            raise ValueError("Ballot stores can only be read on little-endian hosts")
+        self.file = open(fname, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.map)
+        magic, version, elections, ballots, choices, candidates_size, corpus_size, winners_size = HEADER.unpack_from(
+            self.map
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{fname} is not a version {VERSION} ballot store")
+        offset = HEADER.size
+
+        def section(fmt: str, length: int) -> memoryview:
+            nonlocal offset
+            start, offset = offset, offset + length * struct.calcsize(fmt)
+            return view[start:offset].cast(fmt)
+
+        self.election_offsets = section("Q", elections + 1)
+        self.ballot_offsets = section("Q", ballots + 1)
+        self.counts = section("q", ballots)
+        self.winner_offsets = section("Q", elections + 1)
+        self.choices = section("i", choices)
+        self.candidates = json.loads(bytes(section("B", candidates_size)))
+        self.corpus = json.loads(bytes(section("B", corpus_size)))
+        self.winners = section("B", winners_size)
+
+    def __len__(self) -> int:
+        return len(self.election_offsets) - 1
+
+    def __getitem__(self, e):
+        if isinstance(e, slice):
+            return [self[i] for i in range(*e.indices(len(self)))]
+        if e < 0:
+            e += len(self)
+        if not 0 <= e < len(self):
+            raise IndexError("election index out of range")
+        winners = self.winners[self.winner_offsets[e] : self.winner_offsets[e + 1]]
+        return Election(
+            BallotsView(self, self.election_offsets[e], self.election_offsets[e + 1]),
+            json.loads(bytes(winners)),
+        )
+
+    def __iter__(self) -> Iterator[Election]:
+        for e in range(len(self)):
+            yield self[e]
+
+    def ballot(self, b: int) -> Ballot:
+        candidates = self.candidates
+        ranking = self.choices[self.ballot_offsets[b] : self.ballot_offsets[b + 1]]
+        return Ballot(tuple(candidates[c] for c in ranking), self.counts[b])
+
+    def close(self):
+        for name in ("election_offsets", "ballot_offsets", "counts", "winner_offsets", "choices", "winners"):
+            getattr(self, name).release()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self) -> "BallotStore":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_source(fname: str) -> tuple[list[Election], dict[str, Any] | None]:
+    '''Elections (and corpus header, if any) from a JSON corpus/elections/election file or a ballot CSV'''
+    if fname.endswith(".csv"):
+        table = CandidateTable()
+        with open(fname, "r") as f:
+            ballots = read_ballots_csv(f, table)
+        return [Election([Ballot(table.decode(r), votes) for r, votes in ballots.items()], {})], None
+    with open(fname, "r") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return unmarshal_elections(data), None
+    if "elections" in data:
+        return elections_from_corpus(data), {field: data.get(field) for field in CORPUS_FIELDS}
+    return [json_to_Election(data)], None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="convert JSON or CSV elections to a binary ballot store")
+    parser.add_argument("input", type=str, help="corpus, elections or election JSON file, or ballot CSV")
+    parser.add_argument("output", type=str, help="binary store to write")
+    args = parser.parse_args()
+
+    elections, corpus = read_source(args.input)
+    tmp = args.output + ".tmp"
+    with open(tmp, "wb") as f:
+        write_store(elections, f, corpus)
+    os.replace(tmp, args.output)
+    print(f"Wrote {len(elections)} elections to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+'''
+Alpha sweeps over a corpus.
+Each election's pairwise matrix is built once; every (base alpha, alpha cap) setting is then resolved
+from the same vote and distance-weighted sums, so a sweep costs one ballot pass per election.
+'''
+import argparse
+import json
+from typing import Iterable, NamedTuple
+
+from .pairwise import BACKENDS, build_tally, reaches
+from .store import read_source
+from .trace import RoundTrace
+from .types import Election
+
+
+class SweepResult(NamedTuple):
+    base: float
+    cap: float
+    winners: list
+    ties: int
+    tie_rate: float
+    alpha_steps: int
+
+
+def check_setting(base: float, cap: float):
+    '''Doubling only stops at a cap it lands on exactly, as in process_round'''
+    if not reaches(base, cap):
+        raise ValueError(f"Alpha cap {cap} is not reached by doubling base alpha {base}")
+
+
+def sweep_elections(
+    elections: Iterable[Election], settings: list[tuple[float, float]], backend: str = "python"
+) -> list[SweepResult]:
+    '''Single-winner results of every election for every (base alpha, alpha cap) setting'''
+    for base, cap in settings:
+        check_setting(base, cap)
+    winners: dict[tuple[float, float], list] = {setting: [] for setting in settings}
+    steps = {setting: 0 for setting in settings}
+    for election in elections:
+        ballots = {ballot.ranking: ballot.tally for ballot in election.ballots}
+        candidates = list(dict.fromkeys(candidate for ranking in ballots for candidate in ranking))
+        tally = build_tally(ballots, candidates, backend)
+        for setting in settings:
+            stats = RoundTrace(1)
+            winner, _ = tally.resolve(setting[0], setting[1], stats)
+            winners[setting].append(None if winner is None else candidates[winner])
+            steps[setting] += stats.alpha_steps
+    results = []
+    for base, cap in settings:
+        found = winners[(base, cap)]
+        ties = found.count(None)
+        results.append(SweepResult(base, cap, found, ties, ties / len(found) if found else 0.0, steps[(base, cap)]))
+    return results
+
+
+def doubling_settings(bases: list[float], doublings: int) -> list[tuple[float, float]]:
+    '''Caps base * 2, base * 4, ... base * 2 ** doublings for each base'''
+    return [(base, base * 2 ** i) for base in bases for i in range(1, doublings + 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tie rates and winners for several alpha settings at once")
+    parser.add_argument("input", type=str, help="corpus, elections or election JSON file, or ballot CSV")
+    parser.add_argument("--bases", type=float, nargs="+", default=[0.01])
+    parser.add_argument("--caps", type=float, nargs="+", help="alpha caps, each reached by doubling every base (default: --doublings caps per base)")
+    parser.add_argument("--doublings", type=int, default=10, help="caps per base when --caps is not given")
+    parser.add_argument("--backend", default="python", choices=BACKENDS)
+    parser.add_argument("--output", type=str, help="write the full results as JSON")
+    args = parser.parse_args()
+
+    elections, _ = read_source(args.input)
+    if args.caps:
+        settings = [(base, cap) for base in args.bases for cap in args.caps]
+    else:
+        settings = doubling_settings(args.bases, args.doublings)
+    results = sweep_elections(elections, settings, args.backend)
+    for result in results:
+        print(f"base {result.base} cap {result.cap}: {result.ties} ties ({result.tie_rate:.4f}), {result.alpha_steps} alpha steps")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"elections": len(elections), "results": [result._asdict() for result in results]}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+'''
+Structured tracing for counts.
+An ElectionTrace collects one RoundTrace of counters and phase timings per seat and hands each finished
+round to its sinks. Counting code only runs when a trace is passed in, so untraced counts pay nothing.
+'''
+import contextlib
+import json
+import time
+from typing import Any, Hashable, TextIO
+
+
+class RoundTrace:
+    '''Counters, phase timings and optional pairwise margins for one round'''
+
+    __slots__ = (
+        "round",
+        "winner",
+        "alpha",
+        "alpha_steps",
+        "pairs_compared",
+        "ballots_scanned",
+        "early_stops",
+        "timings",
+        "margins",
+    )
+
+    def __init__(self, round: int):
+        self.round = round
+        self.winner: Hashable | None = None
+        # Alpha after the final doubling, as passed on to reweighting
+        self.alpha: float | None = None
+        self.alpha_steps = 0
+        self.pairs_compared = 0
+        self.ballots_scanned = 0
+        # Alpha steps that found a winner before every pair had been compared
+        self.early_stops = 0
+        self.timings: dict[str, float] = {}
+        # (candidate, opponent, candidate points - opponent points) at the last alpha tried
+        self.margins: list[tuple[Hashable, Hashable, float]] | None = None
+
+    def as_dict(self) -> dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class JsonLinesSink:
+    '''Writes one JSON object per round, for audit logs'''
+
+    def __init__(self, f: TextIO):
+        self.f = f
+
+    def emit(self, record: dict[str, Any]):
+        self.f.write(json.dumps(record, default=str) + "\n")
+        self.f.flush()
+
+
+class PrintSink:
+    '''Human-readable round summaries on stdout'''
+
+    def emit(self, record: dict[str, Any]):
+        outcome = "tie" if record["winner"] is None else str(record["winner"]) + " is the round winner"
+        print(
+            f"Round {record['round']}: {outcome} (alpha {record['alpha']}, {record['alpha_steps']} alpha steps, "
+            f"{record['pairs_compared']} pairs compared, {record['ballots_scanned']} ballots scanned)"
+        )
+        for candidate, opponent, margin in record["margins"] or []:
+            print(f"    {candidate} vs {opponent}: {margin:+}")
+
+
+class ElectionTrace:
+    '''Per-round records of a count, emitted to each sink as rounds finish'''
+
+    def __init__(self, *sinks, margins: bool = False):
+        self.sinks = sinks
+        self.margins = margins
+        self.rounds: list[RoundTrace] = []
+
+    def start_round(self) -> RoundTrace:
+        stats = RoundTrace(len(self.rounds) + 1)
+        self.rounds.append(stats)
+        return stats
+
+    def end_round(self, stats: RoundTrace):
+        record = stats.as_dict()
+        for sink in self.sinks:
+            sink.emit(record)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"rounds": [stats.as_dict() for stats in self.rounds]}
+
+
+@contextlib.contextmanager
+def timed_phase(stats: RoundTrace, phase: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.timings[phase] = stats.timings.get(phase, 0.0) + time.perf_counter() - start
+
+
+def phase(stats: RoundTrace | None, name: str):
+    '''Wall-clock timer for a phase of the round, or a no-op when untraced'''
+    return contextlib.nullcontext() if stats is None else timed_phase(stats, name)
@@ -1,4 +1,5 @@
-from typing import Hashable, NamedTuple, Callable
+from array import array
+from typing import Hashable, Iterable, Iterator, NamedTuple, Callable
 
 
 class Ballot(NamedTuple):
@@ -25,4 +26,83 @@ class Corpus(NamedTuple):
     elections: list[Election]
 
 
-Scheme = Callable[[list[Ballot]], Result]
+class BallotProfile:
+    '''
+    Compact ballots: candidates interned to IDs in order of first appearance, every ranking's IDs in one
+    flat array with per-ballot offsets, and weights in a float array. Ballot b ranks
+    candidates[choices[i]] for i in offsets[b]..offsets[b + 1].
+    '''
+
+    __slots__ = ("candidates", "choices", "offsets", "weights")
+
+    def __init__(self):
+        self.candidates: list[Hashable] = []
+        self.choices = array("i")
+        self.offsets = array("q", [0])
+        self.weights = array("d")
+
+    @classmethod
+    def from_items(cls, ballots: Iterable[tuple[tuple[Hashable, ...], float]]) -> "BallotProfile":
+        profile = cls()
+        ids: dict[Hashable, int] = {}
+        for ranking, weight in ballots:
+            for candidate in ranking:
+                candidate_id = ids.get(candidate)
+                if candidate_id is None:
+                    candidate_id = ids[candidate] = len(profile.candidates)
+                    profile.candidates.append(candidate)
+                profile.choices.append(candidate_id)
+            profile.offsets.append(len(profile.choices))
+            profile.weights.append(weight)
+        return profile
+
+    @classmethod
+    def from_ballots(cls, ballots: Iterable[Ballot]) -> "BallotProfile":
+        return cls.from_items((ballot.ranking, ballot.tally) for ballot in ballots)
+
+    @classmethod
+    def from_dict(cls, ballots: dict) -> "BallotProfile":
+        '''From the engine's {ranking: votes} dict'''
+        return cls.from_items(ballots.items())
+
+    def __len__(self) -> int:
+        return len(self.weights)
+
+    def ids(self, b: int) -> array:
+        '''Candidate IDs ranked by ballot b'''
+        return self.choices[self.offsets[b] : self.offsets[b + 1]]
+
+    def ranking(self, b: int) -> tuple[Hashable, ...]:
+        candidates = self.candidates
+        return tuple(candidates[candidate_id] for candidate_id in self.ids(b))
+
+    def items(self) -> Iterator[tuple[tuple[Hashable, ...], float]]:
+        '''(ranking, weight) pairs, like the items of a {ranking: votes} dict'''
+        for b, weight in enumerate(self.weights):
+            yield self.ranking(b), weight
+
+    def to_dict(self) -> dict:
+        '''{ranking: votes}, summing repeated rankings'''
+        ballots = {}
+        for ranking, weight in self.items():
+            ballots[ranking] = ballots.get(ranking, 0) + weight
+        return ballots
+
+    def distinct(self) -> "BallotProfile":
+        '''
+        Each repeated ranking collapsed to its last copy, in order of first appearance, as building a
+        {ranking: votes} dict from ballots does; the profile itself when every ranking is distinct
+        '''
+        last: dict[tuple[int, ...], int] = {}
+        for b in range(len(self)):
+            last[tuple(self.ids(b))] = b
+        if len(last) == len(self):
+            return self
+        return BallotProfile.from_items((self.ranking(b), self.weights[b]) for b in last.values())
+
+    def to_ballots(self) -> list[Ballot]:
+        '''Ballots with whole weights restored to int tallies'''
+        return [Ballot(ranking, int(weight) if weight.is_integer() else weight) for ranking, weight in self.items()]
+
+
+Scheme = Callable[[list[Ballot] | BallotProfile], Result]
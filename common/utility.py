@@ -1,10 +1,14 @@
 import sys
 import json
-from typing import Any, Hashable
+from json.decoder import WHITESPACE
+from typing import Any, Hashable, Iterable, Iterator
 from io import TextIOWrapper
 
 from .types import Ballot, Election, Corpus
 
+# Characters read at a time by JsonStream
+READ_CHUNK = 1 << 16
+
 
 def pretty_ballot_json(ballot: Ballot) -> str:
     return f'{{ "count":{ballot.tally:3}, "ranking": {list(ballot.ranking)} }}'
@@ -101,16 +105,55 @@ def unmarshal_elections(data: Any) -> list[Election]:
     return [unmarshal_election(election) for election in data]
 
 
-def write_elections(elections: list[Election], f: TextIOWrapper):
-    f.write("[\n")
-    f.write(",\n".join(pretty_election_json(election) for election in elections))
-    f.write("\n]\n")
+class ElectionsWriter:
+    """Writes elections one at a time in write_elections' format"""
+
+    def __init__(self, f: TextIOWrapper):
+        self.f = f
+        self.count = 0
+        f.write("[\n")
+
+    def write(self, election: Election):
+        if self.count:
+            self.f.write(",\n")
+        self.f.write(pretty_election_json(election))
+        self.count += 1
+
+    def close(self):
+        self.f.write("\n]\n")
+
+
+def write_elections(elections: Iterable[Election], f: TextIOWrapper):
+    writer = ElectionsWriter(f)
+    for election in elections:
+        writer.write(election)
+    writer.close()
 
 
 def write_corpus(corpus: Any, f: TextIOWrapper):
     json.dump(corpus, f, indent=4)
 
 
+def write_corpus_elections(header: dict[str, Any], elections: Iterable[Election], f: TextIOWrapper):
+    """
+    Stream a corpus in write_corpus' format, marshalling one election at a time.
+    header holds the other fields in order, with an "elections" entry marking where the array goes.
+    """
+    f.write("{")
+    for i, key in enumerate(header):
+        f.write(("," if i else "") + "\n    " + json.dumps(key) + ": ")
+        if key != "elections":
+            f.write(json.dumps(header[key], indent=4).replace("\n", "\n    "))
+            continue
+        count = 0
+        for election in elections:
+            f.write(("," if count else "[") + "\n        ")
+            f.write(json.dumps(marshal_election(election), indent=4).replace("\n", "\n        "))
+            count += 1
+        f.write("\n    ]" if count else "[]")
+    f.write("\n}" if header else "}")
+
+
 def marshal_ballot(ballot: Ballot) -> dict[str, Any]:
     return {"ranking": list(ballot.ranking), "count": ballot.tally}
 
@@ -150,6 +193,116 @@ def read_election(f: TextIOWrapper) -> Election:
     return election
 
 
+class JsonStream:
+    """
+    Incremental reader of a JSON text file.
+    Containers are walked token by token while their elements are decoded one at a time with
+    JSONDecoder.raw_decode, so only the element being read (and one read chunk) is held in memory.
+    """
+
+    def __init__(self, f: TextIOWrapper):
+        self.f = f
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self, size: int = READ_CHUNK) -> bool:
+        """Append more text, dropping what has been consumed; False at end of file"""
+        chunk = "" if self.eof else self.f.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character without consuming it, or "" at end of file"""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos : self.pos + 1]
+
+    def take(self, token: str):
+        found = self.peek()
+        if found != token:
+            raise ValueError(f"Expected {token!r} but found {found!r} in JSON stream")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode the next complete value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Incomplete; read at least as much again, so a large value costs linear time overall
+                if not self.fill(max(READ_CHUNK, len(self.buffer))):
+                    raise
+                continue
+            # A number ending the buffer may continue in the next chunk
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def items(self) -> Iterator[Any]:
+        """Elements of the array starting here, one at a time"""
+        self.take("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() != ",":
+                self.take("]")
+                return
+            self.pos += 1
+
+    def members(self) -> Iterator[str]:
+        """Keys of the object starting here; the caller reads each value before asking for the next key"""
+        self.take("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.take(":")
+            yield key
+            if self.peek() != ",":
+                self.take("}")
+                return
+            self.pos += 1
+
+
+def iter_election_data(f: TextIOWrapper, header: dict[str, Any] | None = None) -> Iterator[Any]:
+    """
+    Raw election objects of a corpus, elections or election JSON file, read one at a time.
+    The other top-level fields of a corpus go into header in file order, with an "elections" entry
+    marking where the array was; header is complete once iteration ends.
+    """
+    stream = JsonStream(f)
+    if stream.peek() == "[":
+        yield from stream.items()
+        return
+    fields: dict[str, Any] = {} if header is None else header
+    for key in stream.members():
+        if key == "elections":
+            fields[key] = None
+            yield from stream.items()
+        else:
+            fields[key] = stream.value()
+    if "elections" not in fields:
+        # A single election
+        yield fields
+
+
+def iter_elections(f: TextIOWrapper, header: dict[str, Any] | None = None) -> Iterator[Election]:
+    """Elections of a JSON file one at a time, so a corpus larger than memory can be counted"""
+    return map(unmarshal_election, iter_election_data(f, header))
+
+
 def main():
     tiow = TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
     data = read_corpus(tiow)
@@ -1,13 +1,16 @@
 import argparse
+import contextlib
+import itertools
 import json
 import math
 import random
+import sys
 
 '''
 Random Election Generator
 '''
 
-def arguments():
+def arguments(argv=None):
     '''Get command line arguments'''
     parser = argparse.ArgumentParser()
     parser.add_argument("-v", "--num-voters", dest="voters", default=10)
@@ -18,25 +21,42 @@ def arguments():
     parser.add_argument("-n", "--num-elections", dest="elections", default=1)
     parser.add_argument("-o", "--output-file", dest="output")
     parser.add_argument("-j", "--output-json", dest="json", default="true")
-    args = parser.parse_args()
+    parser.add_argument("-s", "--seed", dest="seed", type=int, help="seed for reproducible output")
+    args = parser.parse_args(argv)
     return args
 
-def generate_unique_rankings(num, candidates, min_len, max_len, voters):
+# Below this many possible rankings, dense requests are drawn from the full enumeration
+ENUMERATE_LIMIT = 10 ** 6
+
+def possible_rankings(candidates, min_len, max_len):
+    '''Number of distinct rankings with lengths in [min_len, max_len]'''
+    return sum(math.perm(candidates, length) for length in range(min_len, max_len + 1))
+
+def generate_unique_rankings(num, candidates, min_len, max_len, voters, rng=random):
     '''Generate all unique rankings'''
+    possible = possible_rankings(candidates, min_len, max_len)
+    target = min(num, possible, voters)
+    if possible <= ENUMERATE_LIMIT and target * 2 >= possible:
+        # Rejection sampling would mostly draw duplicates, so sample the enumeration instead
+        everything = [ranking for length in range(min_len, max_len + 1)
+                      for ranking in itertools.permutations(range(candidates), length)]
+        return rng.sample(everything, k=target)
+    # Hash-based dedup; each batch draws as many rankings as are still missing
+    seen = set()
     rankings = []
-    i = 0
-    while i < min(num, math.factorial(candidates), voters):
-        length = random.randint(min_len, max_len)
-        ranking = random.sample([i for i in range(candidates)], k=length)
-        if ranking not in rankings:
-            rankings.append(ranking)
-            i += 1
+    pool = range(candidates)
+    while len(rankings) < target:
+        for _ in range(target - len(rankings)):
+            ranking = tuple(rng.sample(pool, k=rng.randint(min_len, max_len)))
+            if ranking not in seen:
+                seen.add(ranking)
+                rankings.append(ranking)
     return rankings
 
-def generate_ballots(voters, rankings):
+def generate_ballots(voters, rankings, rng=random):
         '''Generate all ballots for an election'''
         # Create distribution of votes amongst rankings
-        ranking_distribution = sorted([round(random.uniform(0.0,100.0), 3) for _ in range(len(rankings)-1)]) + [100.0]
+        ranking_distribution = sorted([round(rng.uniform(0.0,100.0), 3) for _ in range(len(rankings)-1)]) + [100.0]
 
         ballots = []
         prev = 0.0
@@ -54,52 +74,40 @@ def generate_ballots(voters, rankings):
             prev = ranking_distribution[i]
         return ballots
 
-def generate_elections(unique, candidates, min_len, max_len, num_elections, voters):
-    '''Generate all elections'''
-    elections = []
+def generate_elections(unique, candidates, min_len, max_len, num_elections, voters, rng=random):
+    '''Generate elections one at a time, so only the election being written is held in memory'''
     for _ in range(num_elections):
 
         # Pull unique rankings and update status
-        rankings = generate_unique_rankings(unique, candidates, min_len, max_len, voters)
+        rankings = generate_unique_rankings(unique, candidates, min_len, max_len, voters, rng)
         
         # Generate ballots
-        ballots = generate_ballots(voters, rankings)
-        elections.append(ballots)
-    return elections
+        yield generate_ballots(voters, rankings, rng)
 
-def output_elections_json(output, elections, voters, candidates, unique, min_len, max_len):
-    json_statement = {"num_voters": voters, "num_candidates": candidates, "max_unique_rankings": unique, \
-                          "max_ranking_length": max_len, "min_ranking_length": min_len, "num_elections": len(elections), \
-                            "elections": [{"ballots": [{"ranking": ranking[0], "count": ranking[1]} for ranking in election]} for election in elections]}
-    if output is None:
-        print(json.dumps(json_statement, indent=4))
-    else:
-        with open(output, "w") as file:
-            file.write(json.dumps(json_statement, indent=4))
+def output_elections_json(output, elections, voters, candidates, unique, min_len, max_len, num_elections):
+    '''Stream a corpus JSON document, one election per line'''
+    header = {"num_voters": voters, "num_candidates": candidates, "max_unique_rankings": unique, \
+                  "max_ranking_length": max_len, "min_ranking_length": min_len, "num_elections": num_elections}
+    with (contextlib.nullcontext(sys.stdout) if output is None else open(output, "w")) as file:
+        file.write(json.dumps(header, indent=4)[:-2] + ',\n    "elections": [\n')
+        for i, election in enumerate(elections):
+            if i != 0:
+                file.write(",\n")
+            file.write("        " + json.dumps({"ballots": [{"ranking": list(ranking[0]), "count": ranking[1]} for ranking in election]}))
+        file.write("\n    ]\n}\n")
 
 def output_elections_csv(output, elections):
-    result = ""
-    for i, election in enumerate(elections):
-        for j, ranking in enumerate(election):
-            result += str(ranking[1]) + ","
-            for k, candidate in enumerate(ranking[0]):
-                if k != len(ranking[0]) - 1:
-                    result += str(candidate) + ","
-                else:
-                    result += str(candidate)
-            if j != len(election) - 1:
-                result += "\n"
-        if i != len(elections) - 1:
-            result += "\n\n"
-    if output is None:
-        print(result)
-    else:
-        with open(output, "w") as file:
-            file.write(result)
+    '''Stream elections as CSV rows, with a blank line between elections'''
+    with (contextlib.nullcontext(sys.stdout) if output is None else open(output, "w")) as file:
+        for i, election in enumerate(elections):
+            if i != 0:
+                file.write("\n")
+            file.writelines(str(ranking[1]) + "," + ",".join(str(candidate) for candidate in ranking[0]) + "\n"
+                            for ranking in election)
 
-def main():
+def main(argv=None):
     # Pull and process arguments
-    args = arguments()
+    args = arguments(argv)
     voters = int(args.voters)
     candidates = int(args.candidates)
     unique = int(args.unique)
@@ -117,9 +125,12 @@ def main():
     output = args.output
     json = args.json.lower()
 
-    elections = generate_elections(unique, candidates, min_len, max_len, num_elections, voters)
+    rng = random.Random(args.seed)
+
+    elections = generate_elections(unique, candidates, min_len, max_len, num_elections, voters, rng)
     if json == 'true' or json == 't':
-        output_elections_json(output, elections, voters, candidates, unique, min_len, max_len)
+        output_elections_json(output, elections, voters, candidates, unique, min_len, max_len, num_elections)
     else:
         output_elections_csv(output, elections)
-main()
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,8 @@ from common.shared_main import shared_main
 from voting_system import scheme
 
 
-def main() -> None:
-    shared_main("elections_test", scheme)
+def main(argv: list[str] | None = None) -> None:
+    shared_main("elections_test", scheme, argv)
 
 
 if __name__ == "__main__":
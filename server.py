@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from common.pairwise import BACKENDS
+from common.types import BallotProfile
+from common.utility import json_to_Election
+from voting_system import tabulate
+
+'''
+Long-running tabulation service
+Accepts elections in the JSON election format over HTTP (TCP or a Unix socket) and returns winners and round traces.
+Concurrent requests are batched onto a process pool, and parsed profiles are kept in an LRU cache keyed by request body.
+
+POST /tabulate  {"ballots": [{"count": 3, "ranking": ["A", "B"]}, ...], "num_winners": 1, "alpha": 0.01, "margins": false}
+GET  /health
+'''
+
+# Requests collected into one batch, and how long the first request of a batch waits for company
+MAX_BATCH = 64
+BATCH_WINDOW = 0.005
+PROFILE_CACHE_SIZE = 1024
+MAX_BODY = 1 << 30
+
+class RequestError(Exception):
+    '''Client error, answered with the given HTTP status'''
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def arguments():
+    '''Get command line arguments'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", dest="host", default="127.0.0.1")
+    parser.add_argument("--port", dest="port", default=8080, type=int)
+    parser.add_argument("-u", "--unix", dest="unix", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("-j", "--jobs", dest="jobs", default=os.cpu_count(), type=int, help="worker processes")
+    parser.add_argument("-b", "--backend", dest="backend", default="python", choices=BACKENDS)
+    parser.add_argument("--batch", dest="batch", default=MAX_BATCH, type=int, help="most requests per batch")
+    parser.add_argument("--window", dest="window", default=BATCH_WINDOW, type=float, help="seconds to wait filling a batch")
+    parser.add_argument("--cache-size", dest="cache_size", default=PROFILE_CACHE_SIZE, type=int, help="parsed profiles kept")
+    return parser.parse_args()
+
+def tabulate_batch(jobs, backend):
+    '''Worker entry point: tabulate a batch of (profile, num_winners, alpha, margins) requests'''
+    results = []
+    for profile, num_winners, alpha, margins in jobs:
+        try:
+            winners, trace = tabulate(profile, num_winners, alpha, backend, margins=margins)
+            winners = [None if winner == (None, None) else winner for winner in winners]
+            results.append({"winners": winners, "rounds": trace.as_dict()["rounds"]})
+        except AssertionError:
+            results.append({"error": "more winners than candidates", "status": 400})
+    return results
+
+def parse_request(body):
+    '''(profile, num_winners, alpha, margins) from a request body'''
+    try:
+        data = json.loads(body)
+        election = json_to_Election(data)
+        num_winners = int(data.get("num_winners", 1))
+        alpha = float(data.get("alpha", 0.01))
+        margins = bool(data.get("margins", False))
+        profile = BallotProfile.from_ballots(election.ballots)
+    except (ValueError, KeyError, TypeError, AttributeError) as error:
+        raise RequestError(400, "malformed election: " + str(error))
+    if num_winners < 1 or alpha <= 0:
+        raise RequestError(400, "num_winners and alpha must be positive")
+    return profile, num_winners, alpha, margins
+
+class ProfileCache:
+    '''LRU cache of parsed requests keyed by a digest of the request body'''
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, body):
+        key = hashlib.sha256(body).digest()
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        job = parse_request(body)
+        if self.maxsize > 0:
+            self.entries[key] = job
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return job
+
+class Batcher:
+    '''Collects concurrent requests into batches and runs each batch as one call on the worker pool'''
+    def __init__(self, pool, backend, max_batch, window):
+        self.pool = pool
+        self.backend = backend
+        self.max_batch = max_batch
+        self.window = window
+        self.queue = asyncio.Queue()
+        self.batches = 0
+        self.requests = 0
+
+    async def submit(self, job):
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((job, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Dispatch without waiting, so the next batch fills while this one runs
+            loop.create_task(self.dispatch(batch))
+
+    async def dispatch(self, batch):
+        self.batches += 1
+        self.requests += len(batch)
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.pool, tabulate_batch, [job for job, _ in batch], self.backend)
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+class Server:
+    def __init__(self, batcher, profiles):
+        self.batcher = batcher
+        self.profiles = profiles
+
+    async def handle(self, reader, writer):
+        '''Serve HTTP/1.1 requests on one connection until the client closes it'''
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "bad request"}, close=True)
+                    break
+                if length > MAX_BODY:
+                    await self.respond(writer, 413, {"error": "request body too large"}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                status, response = await self.route(method, path, body)
+                close = headers.get("connection", "").lower() == "close"
+                await self.respond(writer, status, response, close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        if path == "/health":
+            return 200, {"status": "ok", "batches": self.batcher.batches, "requests": self.batcher.requests,
+                         "profile_hits": self.profiles.hits, "profile_misses": self.profiles.misses}
+        if path != "/tabulate":
+            return 404, {"error": "not found"}
+        if method != "POST":
+            return 405, {"error": "use POST"}
+        try:
+            result = await self.batcher.submit(self.profiles.parse(body))
+        except RequestError as error:
+            return error.status, {"error": str(error)}
+        except Exception as error:
+            return 500, {"error": "tabulation failed: " + repr(error)}
+        if "error" in result:
+            return result.pop("status"), result
+        return 200, result
+
+    async def respond(self, writer, status, response, close=False):
+        body = json.dumps(response, default=str).encode()
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}[status]
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+async def serve(args):
+    with ProcessPoolExecutor(args.jobs) as pool:
+        batcher = Batcher(pool, args.backend, args.batch, args.window)
+        server = Server(batcher, ProfileCache(args.cache_size))
+        batching = asyncio.create_task(batcher.run())
+        if args.unix:
+            listener = await asyncio.start_unix_server(server.handle, path=args.unix)
+        else:
+            listener = await asyncio.start_server(server.handle, args.host, args.port)
+        address = args.unix or f"http://{args.host}:{args.port}"
+        print("Serving on " + address, file=sys.stderr)
+        try:
+            async with listener:
+                await listener.serve_forever()
+        finally:
+            batching.cancel()
+
+def main():
+    args = arguments()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,26 @@
-import matplotlib.pyplot as plt
-def visualize_alpha():
-    alphas = [0.01*(2**i) for i in range(1, 16)]
-    rounds = [i for i in range(1, 16)]
-    total_elections = 70720
-    ties = [i/total_elections for i in [9724, 9694, 9567, 9180, 8201, 7226, 5992, 5242, 4878, 4670, 4631, 4615, 4614, 4614, 4614]]
+import argparse
+import json
+from common.store import read_source
+from common.sweep import doubling_settings, sweep_elections
+
+# Ties in the 70,720-election corpus for maximum α = 0.01 * 2^n, n = 1..15
+TOTAL_ELECTIONS = 70720
+TIES = [9724, 9694, 9567, 9180, 8201, 7226, 5992, 5242, 4878, 4670, 4631, 4615, 4614, 4614, 4614]
+DOUBLINGS = 15
+
+def sweep_ties(results, total_elections):
+    '''Maximum α values and tie counts from common.sweep results for a single base α'''
+    results = sorted(results, key=lambda result: result["cap"])
+    return [result["cap"] for result in results], [result["ties"] for result in results], total_elections
+
+def visualize_alpha(alphas=None, ties=None, total_elections=TOTAL_ELECTIONS):
+    # Imported here so the module loads without matplotlib
+    import matplotlib.pyplot as plt
+    if alphas is None:
+        alphas = [0.01*(2**i) for i in range(1, DOUBLINGS + 1)]
+        ties = TIES
+    rounds = [i for i in range(1, len(alphas) + 1)]
+    ties = [i/total_elections for i in ties]
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 7))
     fig.suptitle("α Limits and Percentage Ties\nα = 0.01 * (2^n)")
     ax1.set_xticks(rounds, alphas)
@@ -16,4 +33,25 @@ def visualize_alpha():
     ax2.plot(rounds, ties, color="blue", linewidth=4)
     plt.savefig('alpha.png')
     plt.show()
-visualize_alpha()
\ No newline at end of file
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--sweep", type=str, help="results JSON written by python3 -m common.sweep --output")
+    group.add_argument("--corpus", type=str, help="corpus or elections JSON to sweep now")
+    args = parser.parse_args(argv)
+
+    if args.sweep:
+        with open(args.sweep, "r") as f:
+            data = json.load(f)
+        visualize_alpha(*sweep_ties(data["results"], data["elections"]))
+    elif args.corpus:
+        elections, _ = read_source(args.corpus)
+        results = sweep_elections(elections, doubling_settings([0.01], DOUBLINGS))
+        visualize_alpha(*sweep_ties([result._asdict() for result in results], len(elections)))
+    else:
+        # Published results, so the figure can be redrawn without the corpus
+        visualize_alpha()
+
+if __name__ == "__main__":
+    main()
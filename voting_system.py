@@ -1,99 +1,90 @@
 import argparse
-from common.types import Ballot, Scheme
+import contextlib
+import itertools
+import json
+import sys
+import time
+from collections import deque
+from common.types import Ballot, BallotProfile, Scheme
+from common.ingest import CandidateTable, print_progress, read_ballots_csv, read_elections_csv
+from common.fixed import WEIGHT_BITS, fixed_alpha, fixed_ballots
+from common.pairwise import BACKENDS, MAX_ALPHA, IncrementalTally, PairwiseTally, build_tally, reaches
+from common.trace import ElectionTrace, JsonLinesSink, PrintSink, RoundTrace, phase
+from common import profiling
 import math
+from typing import TYPE_CHECKING
 
-def process_round(ballots : dict, candidates : list, alpha : float = 0.01, last_round : bool = False, verbose : bool = True) -> dict:
+if TYPE_CHECKING:
+    # Only needed for annotations; keeps hashlib and sqlite3 out of a plain import
+    from common.cache import ResultCache
+
+def process_round(ballots : dict | BallotProfile, candidates : list, alpha : float = 0.01, last_round : bool = False, verbose : bool = True, backend : str = "python", trace : ElectionTrace = None) -> dict:
     '''
     Main function to generate winner from given ballots and alpha (hyperparameter) value.
     Uses Condorcet winner criterion to calculate a matrix for each pair of candidates, but where the number of votes (points)
     is manipulated by the alpha value to enforce (but not guarantee) determinism.
     Ballot votes (individual voting power) is recalculated with recalculate_ballots() once a winner is determined, similar to STV.
+    Counters and timings go to trace if given; verbose prints a round summary with pairwise margins.
     '''
-    score = {candidate : 0 for candidate in candidates}
-    if verbose:
-        print("ROUND START")
-    # Continues to loop while a winner is not found
-    while (len(candidates) - 1) not in score.values():
-        # Tie if alpha reaches infinity
-        if alpha == 10.24:
-            return None if last_round else None, None
-        if verbose:
-            print("Alpha: " + str(alpha))
-        score = {candidate : 0 for candidate in candidates}
-        pairs = [(candidate, candidate) for candidate in candidates]
-        stop = False
-        # Do Concorcet matrix calculations with distance
-        for candidate in candidates:
-            for opponent in candidates:
-                # Check to verify that pair has not already done a head-to-head match
-                if not stop and (candidate, opponent) not in pairs:
-                    if verbose:
-                        print(str(candidate) + " vs " + str(opponent))
-                    candidate_points, opponent_points = 0, 0
-                    for ranking, votes in ballots.items():
-                        if candidate not in ranking and opponent not in ranking:
-                            # On absense of both candidate and opponent, ignore pair
-                            continue
-                        elif candidate in ranking and opponent not in ranking:
-                            # On appearance of candidate but absense of opponent, give equivalent of distance 1-modified votes to candidate
-                            candidate_points += votes * (1 + alpha)
-                        elif candidate not in ranking and opponent in ranking:
-                            # On apperance of opponent but absense of candidate, give equivalent of distance 1-modified votes to opponent
-                            opponent_points += votes * (1 + alpha)
-                        else:
-                            # On appearance of both candidate and opponent, calculate distance in ranking between candidate and opponent
-                            # General formula for distance-modified votes is votes * (1 + distance * alpha)
-                            # For v = 10000, d = 5, a = 0.01, dmv = 10000 * (1 + 5 * 0.01) = 10500 votes after modification
-                            distance = ranking.index(candidate) - ranking.index(opponent)
-                            if distance < 0:
-                                candidate_points += votes * (1 + abs(distance) * alpha)
-                            else:
-                                opponent_points += votes * (1 + abs(distance) * alpha)
-                    if candidate_points > opponent_points:
-                        score[candidate] += 1
-                        if score[candidate] == len(candidates) - 1:
-                            stop = True
-                        if verbose:
-                            print(str(candidate) + " beat " + str(opponent) + " " + str(candidate_points) + " to " + str(opponent_points))
-                    elif opponent_points > candidate_points:
-                        score[opponent] += 1
-                        if score[opponent] == len(candidates) - 1:
-                            stop = True
-                        if verbose:
-                            print(str(opponent) + " beat " + str(candidate) + " " + str(opponent_points) + " to " + str(candidate_points))
-                    pairs.append((opponent, candidate))
-                    pairs.append((candidate, opponent))
-        # Increase alpha proportionally every iteration until winner found
-        alpha *= 2
-
-    if verbose:
-        print("Round results: " + str(score))
-    winner = list(filter(lambda x : score[x] == len(candidates) - 1, score))[0]
-    if verbose:
-        print(str(winner) + " is the round winner\n")
+    if trace is None and verbose:
+        trace = ElectionTrace(PrintSink(), margins=True)
+    stats = trace.start_round() if trace is not None else None
+    # One pass over the ballots yields every pairwise tally as a function of alpha
+    with phase(stats, "tally"):
+        tally = build_tally(ballots, candidates, backend)
+    if stats is not None:
+        stats.ballots_scanned += len(ballots)
+    winner, alpha = resolve_round(tally, alpha, stats, trace is not None and trace.margins)
+    if winner is not None and not last_round:
+        with phase(stats, "reweight"):
+            new_ballots = recalculate_ballots(ballots, winner, alpha)
+    if trace is not None:
+        trace.end_round(stats)
+    if winner is None:
+        return None if last_round else None, None
     if last_round:
         return winner
     else:
-        return winner, recalculate_ballots(ballots, winner, alpha)
+        return winner, new_ballots
+
+def resolve_round(tally : PairwiseTally, alpha : float, stats : RoundTrace = None, margins : bool = False):
+    '''Increase alpha proportionally every iteration until winner found, tie (None) if alpha reaches infinity'''
+    with phase(stats, "resolve"):
+        winner, final_alpha = tally.resolve(alpha, fixed_alpha(MAX_ALPHA) if tally.fixed_point else MAX_ALPHA, stats)
+    winner = None if winner is None else tally.candidates[winner]
+    if stats is not None:
+        stats.winner = winner
+        stats.alpha = float(final_alpha)
+        if margins:
+            # Margins at the last alpha tried, which is the one before the final doubling
+            stats.margins = tally.margins(final_alpha / 2 if stats.alpha_steps else final_alpha)
+            if tally.fixed_point:
+                # Reported in votes rather than weight units
+                stats.margins = [(candidate, opponent, float(margin / (1 << WEIGHT_BITS))) for candidate, opponent, margin in stats.margins]
+    return winner, final_alpha
 
 '''For elections.json'''
-def elections_test(ballots : list[Ballot]):
-    converted_ballots = {ballot.ranking : ballot.tally for ballot in ballots}
-    candidates = []
-    for ranking in converted_ballots.keys():
-        for candidate in ranking:
-            if candidate not in candidates:
-                candidates.append(candidate)
+def elections_test(ballots : list[Ballot] | BallotProfile):
+    if isinstance(ballots, BallotProfile):
+        # Repeated rankings count once, with the last copy's votes, as in the dict below
+        converted_ballots = ballots.distinct()
+        candidates = converted_ballots.candidates
+    else:
+        converted_ballots = {ballot.ranking : ballot.tally for ballot in ballots}
+        candidates = list(dict.fromkeys(candidate for ranking in converted_ballots for candidate in ranking))
     winner = process_round(converted_ballots, candidates, last_round=True, verbose=False)
     return (winner, True) if winner not in [None, (None, None)] else (None, False)
 scheme: Scheme = elections_test
 
-def recalculate_ballots(ballots : dict, winner : str, alpha : float) -> dict:
+def recalculate_ballots(ballots : dict | BallotProfile, winner : str, alpha : float) -> dict | BallotProfile:
     '''
     Loop through ballots, recalculating votes (changing voting power) according to the distance the winner was from first choice
     Uses alpha, which may have increased from the original quantity based on the number of loops necessary to choose winner
     Logic: if it was more difficult to choose a winner, then the race was close, and those that lost out should have a larger advantage next round
+    A BallotProfile is reweighted into a new BallotProfile
     '''
+    if isinstance(ballots, BallotProfile):
+        return BallotProfile.from_dict(recalculate_ballots(ballots.to_dict(), winner, alpha))
     new_ballots = {}
     for ballot in ballots:
         if len(ballot) != 1:
@@ -105,53 +96,194 @@ def recalculate_ballots(ballots : dict, winner : str, alpha : float) -> dict:
                 new_ballots[ballot_without_winner] += ballots[ballot] / (1 + (len(ballot) - distance_from_first) * alpha)
     return new_ballots
 
-def process_election(ballots : dict, num_winners : int, alpha : float) -> list:
-    '''Function to process a multi-winner election'''
+def process_election(ballots : dict | BallotProfile, num_winners : int, alpha : float, backend : str = "python", trace : ElectionTrace = None, cache : "ResultCache" = None, fixed_point : bool = False) -> list:
+    '''
+    Function to process a multi-winner election
+    The pairwise matrix is built once and updated in place as each winner is removed and ballots are reweighted,
+    giving the same rounds as calling process_round and recalculate_ballots for every seat
+    Per-round counters and timings are recorded in trace if one is given
+    With a cache, equivalent elections (up to candidate labels and ballot order) are only counted once
+    With fixed_point, weights are integer units and alpha an exact decimal, so results do not depend on summation order (see common.fixed)
+    '''
+    if cache is not None and trace is None:
+        params = ("process_election", num_winners, alpha) + (("fixed_point",) if fixed_point else ())
+        return cache.lookup(ballots.items(), params,
+                            lambda: process_election(ballots, num_winners, alpha, backend, fixed_point=fixed_point))
+    if fixed_point:
+        ballots = fixed_ballots(ballots)
+        alpha = fixed_alpha(alpha)
     winners = []
-    new_ballots = ballots
+    # Ballots the last elect() rescanned, which feed the next round's matrix
+    touched = 0
+    stats = trace.start_round() if trace is not None else None
+    with phase(stats, "tally"):
+        election = IncrementalTally(ballots, backend, fixed_point)
+    if stats is not None:
+        stats.ballots_scanned += len(ballots)
     for i in range(num_winners):
         if None in winners:
             return winners
-        candidates = []
-        for ballot in new_ballots:
-            for candidate in ballot:
-                if candidate not in candidates:
-                    candidates.append(candidate)
-        assert num_winners - (i + 1) < len(candidates)
-        if i != num_winners - 1:
-            winner, new_ballots = process_round(new_ballots, candidates, alpha)
-        else:
-            winner = process_round(new_ballots, candidates, alpha, last_round=True)
+        if stats is None and trace is not None:
+            stats = trace.start_round()
+            stats.ballots_scanned += touched
+        with phase(stats, "tally"):
+            tally = election.round_tally()
+        assert num_winners - (i + 1) < len(tally.candidates)
+        last_round = i == num_winners - 1
+        winner, round_alpha = resolve_round(tally, alpha, stats, trace is not None and trace.margins)
+        if winner is not None and not last_round:
+            with phase(stats, "reweight"):
+                touched = election.elect(winner, round_alpha)
+        if trace is not None:
+            trace.end_round(stats)
+            stats = None
+        if winner is None:
+            # process_round reports a final-round tie as (None, None)
+            winners.append((None, None) if last_round else None)
+            continue
         winners.append(winner)
     return winners
 
-'''Comment out main function and main call if running elections.json'''
-def main():
+def tabulate(ballots : dict | BallotProfile, num_winners : int, alpha : float, backend : str = "python", sinks : tuple = (), margins : bool = False, fixed_point : bool = False):
+    '''Run process_election and return the winners alongside its ElectionTrace'''
+    trace = ElectionTrace(*sinks, margins=margins)
+    winners = process_election(ballots, num_winners, alpha, backend, trace, fixed_point=fixed_point)
+    return winners, trace
+
+# Elections sent to a worker at a time when tabulating a multi-election file
+BULK_CHUNK = 64
+
+def tie_round(winners : list):
+    '''Index of the round that ended in a tie, or None; a final-round tie is reported as (None, None)'''
+    for i, winner in enumerate(winners):
+        if winner is None or winner == (None, None):
+            return i
+    return None
+
+def tabulate_chunk(elections : list, num_winners : int, alpha : float, backend : str = "python", fixed_point : bool = False, timed : bool = False) -> list:
+    '''
+    Worker entry point for bulk tabulation: one result per election, with a tied round as None
+    With timed, each result also carries a "profile" entry: seconds, ballots and the count's summed phase timings
+    '''
+    results = []
+    for ballots in elections:
+        trace = ElectionTrace() if timed else None
+        start = time.perf_counter() if timed else 0.0
+        try:
+            winners = process_election(ballots, num_winners, alpha, backend, trace, fixed_point=fixed_point)
+            result = {"winners": [None if winner == (None, None) else winner for winner in winners]}
+        except AssertionError:
+            result = {"error": "more winners than candidates"}
+        if timed:
+            timings = {}
+            for stats in trace.rounds:
+                for name, seconds in stats.timings.items():
+                    timings[name] = timings.get(name, 0.0) + seconds
+            result["profile"] = {"seconds": time.perf_counter() - start, "ballots": len(ballots), "timings": timings}
+        results.append(result)
+    return results
+
+def bulk_results(elections, num_winners : int, alpha : float, backend : str = "python", fixed_point : bool = False, jobs : int = 1, timed : bool = False):
+    '''
+    Tabulate a stream of elections, yielding one result per election in input order as they are counted
+    With several jobs, elections go to a process pool in chunks of BULK_CHUNK and at most two chunks per worker
+    are in flight, so memory stays bounded however long the stream is
+    '''
+    if jobs <= 1:
+        for ballots in elections:
+            yield from tabulate_chunk([ballots], num_winners, alpha, backend, fixed_point, timed)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    elections = iter(elections)
+    with ProcessPoolExecutor(jobs) as pool:
+        pending = deque()
+        for chunk in iter(lambda: list(itertools.islice(elections, BULK_CHUNK)), []):
+            pending.append(pool.submit(tabulate_chunk, chunk, num_winners, alpha, backend, fixed_point, timed))
+            if len(pending) >= 2 * jobs:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def count_elections(args, num_winners, alpha, profile=None):
+    '''--multi: tabulate every election of the file, writing one JSON line each as it is counted'''
+    with open(args.ballots, "r") as elections, (open(args.output, "w") if args.output else contextlib.nullcontext(sys.stdout)) as output:
+        elections = read_elections_csv(elections, print_progress if args.progress else None)
+        if profile is not None:
+            elections = profile.timed("parse", elections)
+        results = bulk_results(elections, num_winners, alpha, args.backend, args.fixed_point, args.jobs or 1, profile is not None)
+        for i, result in enumerate(results):
+            if profile is not None:
+                stats = result.pop("profile")
+                profile.election(i, stats["ballots"], stats["seconds"])
+                profile.emit(stats)
+            with profiling.phase(profile, "write"):
+                output.write(json.dumps({"election": i, **result}) + "\n")
+                output.flush()
+    if args.progress:
+        print(file=sys.stderr)
+
+def count_election(args, num_winners, alpha, profile=None):
+    '''Tabulate the file's one election and print the winners'''
+    candidates = CandidateTable()
+    with profiling.phase(profile, "parse"):
+        with open(args.ballots, "r") as election:
+            ballots = read_ballots_csv(election, candidates, print_progress if args.progress else None)
+        if args.progress:
+            print(file=sys.stderr)
+        ballots = candidates.decode_ballots(ballots)
+
+    sinks = [PrintSink()] if args.verbose else []
+    if profile is not None:
+        # Folds each round's tally, resolve and reweight timings into the run's phases
+        sinks.append(profile)
+    with (open(args.trace, "a") if args.trace else contextlib.nullcontext()) as audit:
+        if audit is not None:
+            sinks.append(JsonLinesSink(audit))
+        start = time.perf_counter()
+        winners, _ = tabulate(ballots, num_winners, alpha, args.backend, tuple(sinks), margins=args.verbose or audit is not None, fixed_point=args.fixed_point)
+        if profile is not None:
+            profile.election(0, len(ballots), time.perf_counter() - start)
+    with profiling.phase(profile, "write"):
+        print("ELECTION RESULTS")
+        tied = tie_round(winners)
+        if tied is not None:
+            print("There was a tie in round " + str(tied+1) + ".")
+        else:
+            for i, winner in enumerate(winners):
+                print(str(i+1) + ". " + winner)
+def main(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument("-e", "--election-file", dest="ballots", required=True)
     parser.add_argument("-n", "--num-winners", dest="num_winners", default=1)
     parser.add_argument("-a", "--alpha", dest="alpha", default=0.01)
-    args = parser.parse_args()
+    parser.add_argument("-b", "--backend", dest="backend", default="python", choices=BACKENDS)
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int, help="worker processes for the parallel backend (default: one per CPU), or for elections with --multi (default: 1)")
+    parser.add_argument("-m", "--multi", dest="multi", action="store_true", help="the file holds several elections separated by blank lines; print one JSON line per election")
+    parser.add_argument("-o", "--output", dest="output", help="write --multi results to this file instead of stdout")
+    parser.add_argument("-x", "--fixed-point", dest="fixed_point", action="store_true", help="exact integer fixed-point counting")
+    parser.add_argument("-p", "--progress", dest="progress", action="store_true")
+    parser.add_argument("-v", "--verbose", dest="verbose", action="store_true", help="print round summaries and pairwise margins")
+    parser.add_argument("-t", "--trace", dest="trace", help="append JSON-lines round records to this file")
+    profiling.add_profile_arguments(parser)
+    args = parser.parse_args(argv)
 
     num_winners = int(args.num_winners)
     alpha = float(args.alpha)
+    if args.multi and (args.backend == "parallel" or args.verbose or args.trace):
+        parser.error("--multi does not support the parallel backend, --verbose or --trace")
+    if args.fixed_point and args.backend == "numpy":
+        parser.error("--fixed-point needs the python, parallel or sparse backend")
+    if args.fixed_point and not reaches(fixed_alpha(alpha), fixed_alpha(MAX_ALPHA)):
+        parser.error(f"--fixed-point needs an alpha that doubles to exactly {MAX_ALPHA}")
+    if args.backend == "parallel":
+        from common import pairwise_parallel
+        pairwise_parallel.configure(args.jobs)
+    profile = profiling.RunProfile.from_args(args)
+    with profile if profile is not None else contextlib.nullcontext():
+        if args.multi:
+            count_elections(args, num_winners, alpha, profile)
+        else:
+            count_election(args, num_winners, alpha, profile)
 
-    ballots = {}
-    with open(args.ballots, "r") as election:
-        for line in election:
-            split = line.strip().split(",")
-            if split[1] == '':
-                continue
-            votes = int(split[0])
-            ranking = tuple(split[1:])
-            ballots[ranking] = votes
-
-    winners = process_election(ballots, num_winners, alpha)
-    print("ELECTION RESULTS")
-    if None in winners:
-        print("There was a tie in round " + str(winners.index(None)+1) + ".")
-    else:
-        for i, winner in enumerate(winners):
-            print(str(i+1) + ". " + winner)
-main()
-
+if __name__ == "__main__":
+    main()